@@ -0,0 +1,190 @@
+"""
+Measures the throughput and the peak memory of the data pipeline on synthetic datasets of different sizes, and writes the results as JSON.
+Covers ``Dataset.save``, ``Dataset.proteins``, ``Task.transform`` and ``Task.loader``, for every combination of the given dataset sizes, shard sizes and batch sizes. Every case runs in a fresh process, such that the peak resident memory is that of the case alone.
+
+Run it from the repository root as a module, which imports the package from the working tree, or install the package first with ``pip install -e .``:
+
+    python -m benchmarks.benchmark --sizes 1000 100000 --shard-sizes 256 1024 --batch-sizes 32 128 --output results.json
+
+Compare the ``items_per_second``, ``mb_per_second`` and ``peak_rss`` of two result files to find regressions between releases.
+"""
+
+import argparse, json, os, platform, sys, tempfile
+from pathlib import Path
+from time import perf_counter
+from multiprocessing import get_context
+import numpy as np
+from proteinshake.dataset import Dataset
+from proteinshake.task import Task
+from proteinshake.adapters import SyntheticAdapter
+from proteinshake.targets import AttributeTarget
+from proteinshake.metrics import AccuracyMetric
+from proteinshake.transform import DataTransform
+from proteinshake.framework import Framework
+from proteinshake.representations import PointRepresentationTransform
+from proteinshake.utils import (
+    ColumnarReader,
+    ProteinGenerator,
+    Stats,
+    measure,
+    measured,
+    directory_size,
+    peak_memory,
+)
+
+
+class SyntheticDataset(Dataset):
+    size = 0
+
+    def release(self, version=None):
+        proteins = SyntheticAdapter().download(self.size, length=None)
+        # the generation is timed separately from saving
+        proteins = ProteinGenerator(
+            measured(proteins, "generate"), len(proteins), proteins.assets
+        )
+        return self.save(proteins, version)
+
+
+class NumpyFrameworkTransform(Framework, DataTransform):
+    """Passes the batches of the task loader through as numpy arrays."""
+
+    def transform(self, X):
+        return X
+
+    def create_loader(self, iterator, **kwargs):
+        return iterator()
+
+
+def _dataset(root, size):
+    SyntheticDataset.size = size
+    return SyntheticDataset(root=Path(root) / "datasets", online=False)
+
+
+def _task(root, size, shard_size):
+    class SyntheticTask(Task):
+        dataset = _dataset(root, size)
+        target = AttributeTarget()
+        metrics = AccuracyMetric()
+
+    return SyntheticTask(
+        root=Path(root) / "tasks" / str(shard_size), shard_size=shard_size, profile=True
+    )
+
+
+def _transforms():
+    return PointRepresentationTransform(mode="padded"), NumpyFrameworkTransform()
+
+
+def _batch_bytes(batch):
+    if isinstance(batch, tuple):
+        return sum(_batch_bytes(part) for part in batch)
+    if isinstance(batch, np.ndarray) and batch.dtype != object:
+        return batch.nbytes
+    return 0
+
+
+def run_case(case, root, size, shard_size=None, batch_size=None):
+    """Runs a benchmark case and returns its measurements."""
+    result = {"case": case, "size": size}
+    stats = Stats()
+    with stats:
+        if case == "save":
+            with measure("save"):
+                dataset = _dataset(root, size)
+            items, nbytes = size, directory_size(dataset.path)
+            seconds = stats.stages["save"]["seconds"]
+        elif case == "proteins":
+            dataset = _dataset(root, size)
+            start = perf_counter()
+            items = sum(1 for _ in dataset.proteins())
+            seconds = perf_counter() - start
+            # only the columnar store is read if it exists, otherwise only the avro file
+            if ColumnarReader.exists(dataset.path / "columns"):
+                nbytes = directory_size(dataset.path / "columns")
+            else:
+                nbytes = os.path.getsize(dataset.path / "proteins.avro")
+        elif case == "transform":
+            result["shard_size"] = shard_size
+            task = _task(root, size, shard_size)
+            start = perf_counter()
+            task.transform(*_transforms())
+            seconds = perf_counter() - start
+            items = size
+            nbytes = directory_size(task.cache_path)
+            stats = task.stats
+        elif case == "loader":
+            result.update(shard_size=shard_size, batch_size=batch_size)
+            task = _task(root, size, shard_size).transform(*_transforms())
+            task.stats = Stats()
+            loader = task.loader(split="train", batch_size=batch_size, shuffle=True)
+            start = perf_counter()
+            items, nbytes = 0, 0
+            for batch in loader:
+                items += len(batch[1])
+                nbytes += _batch_bytes(batch)
+            seconds = perf_counter() - start
+            stats = task.stats
+    return {
+        **result,
+        "items": items,
+        "bytes": nbytes,
+        "seconds": seconds,
+        "items_per_second": items / max(seconds, 1e-9),
+        "mb_per_second": nbytes / 1e6 / max(seconds, 1e-9),
+        "peak_rss": peak_memory(),
+        "stages": stats.report()["stages"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="ProteinShake benchmark",
+        description="Measures the throughput and peak memory of the data pipeline on synthetic datasets.",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--shard-sizes", type=int, nargs="+", default=[1024])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 256])
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument(
+        "--root", default=None, help="Working directory, by default a temporary one"
+    )
+    args = parser.parse_args()
+
+    cases = []
+    for size in args.sizes:
+        cases += [("save", size), ("proteins", size)]
+        for shard_size in args.shard_sizes:
+            cases.append(("transform", size, shard_size))
+            for batch_size in args.batch_sizes:
+                cases.append(("loader", size, shard_size, batch_size))
+
+    results = []
+    context = get_context("spawn")
+    with tempfile.TemporaryDirectory(dir=args.root) as tmp:
+        for case in cases:
+            root = Path(tmp) / str(case[1])
+            # a fresh process per case, such that the peak memory is not inherited
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (case[0], root, *case[1:]))
+            print(
+                f"{result['case']:>10} size={result['size']} shard_size={result.get('shard_size')} batch_size={result.get('batch_size')}: "
+                f"{result['items_per_second']:.0f} items/s, {result['mb_per_second']:.1f} MB/s, {result['peak_rss'] / 1e6:.0f} MB peak RSS"
+            )
+            results.append(result)
+
+    report = {
+        "environment": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "arguments": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,255 @@
 from pathlib import Path
-from typing import Union
-import os
+from typing import Union, List, Tuple, Iterator, Callable, Dict
+from functools import partial
+from collections import Counter
+from itertools import islice
+import os, hashlib, time, tarfile, zipfile
 
 from ..adapter import Adapter
 from ..processor import Processor
-from ..utils import ProteinGenerator
+from ..dataset import VersionReader
+from ..utils import ProteinGenerator, parallel_map, load, warn
+
+
+def _process_files(sources: List[Tuple]) -> List[Tuple]:
+    # failures are returned instead of raised, such that one bad file does not end the ingestion
+    results = []
+    for key, name, data, entry in sources:
+        # unchanged since the previous release, copied by the caller
+        if "hash" in entry:
+            results.append((key, None, entry, None))
+            continue
+        try:
+            if data is None:
+                with open(name, "rb") as file:
+                    data = file.read()
+            protein = Processor.process(name, data)
+            entry = {**entry, "hash": hashlib.sha256(data).hexdigest()}
+            results.append((key, protein, entry, None))
+        except Exception as e:
+            results.append((key, None, entry, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def is_archive(path: Union[str, Path]) -> bool:
+    """Checks if a file is a tar (optionally compressed) or zip archive, by its extension."""
+    return str(path).endswith((".tar", ".zip")) or is_compressed_tar(path)
+
+
+def is_compressed_tar(path: Union[str, Path]) -> bool:
+    """Checks if a file is a compressed tar archive, which can only be listed by decompressing it."""
+    return str(path).endswith(
+        (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+    )
+
+
+def archive_members(path: Union[str, Path]) -> List[str]:
+    """Lists the protein structure files in an archive. Compressed tar archives have to be decompressed to list their members, see ``is_compressed_tar``.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        The archive path.
+
+    Returns
+    -------
+    List[str]
+        The member names, in the order of the archive.
+    """
+    if str(path).endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+    else:
+        with tarfile.open(path, "r:*") as archive:
+            names = [member.name for member in archive if member.isfile()]
+    return [name for name in names if Processor.is_protein_file(name)]
+
+
+def read_archive(path: Union[str, Path]) -> Iterator[Tuple[str, int, int, Callable]]:
+    """Streams the protein structure files of an archive, without extracting them to disk. Tar archives are read sequentially, such that compressed archives are decompressed only once.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        The archive path.
+
+    Yields
+    ------
+    Tuple[str, int, int, Callable]
+        The name, size and modification time of every member, and a function returning its content. The function has to be called before the next member is requested.
+    """
+    if str(path).endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and Processor.is_protein_file(info.filename):
+                    mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+                    yield info.filename, info.file_size, mtime, partial(
+                        archive.read, info
+                    )
+        return
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and Processor.is_protein_file(member.name):
+                read = lambda member=member: archive.extractfile(member).read()
+                yield member.name, member.size, int(member.mtime), read
 
 
 class LocalAdapter(Adapter):
+    """Processes the protein structure files of a local directory (recursively).
+    Structure files can be compressed with gzip, bzip2 or xz (e.g. ``1abc.pdb.gz``), or members of tar, compressed tar or zip archives, which are streamed without extracting them.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = "",
+        num_workers: int = 0,
+        chunk_size: int = 16,
+        ordered: bool = True,
+    ) -> None:
+        """
 
-    def __init__(self, path: Union[str, Path] = "") -> None:
+        Parameters
+        ----------
+        path : Union[str, Path], optional
+            The directory of the structure files, or a single archive, by default ""
+        num_workers : int, optional
+            The number of processes parsing the files, by default 0 (in the calling process)
+        chunk_size : int, optional
+            The number of files submitted to a worker at once, by default 16
+        ordered : bool, optional
+            Whether to yield the proteins in the order of the files when parsing in parallel, or as they complete, by default True
+        """
         self.path = Path(path)
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.ordered = ordered
 
-    def download(self):
-        files = [
+    def files(self) -> List[str]:
+        """Lists the protein structure files and archives in the directory, sorted by path."""
+        if os.path.isfile(self.path):
+            return [str(self.path)]
+        return sorted(
             os.path.join(root, file)
             for root, dirs, files in os.walk(self.path)
             for file in files
-            if Processor.is_protein_file(file)
-        ]
+            if is_archive(file) or Processor.is_protein_file(file)
+        )
+
+    def _entry(
+        self, previous: Dict, key: str, size: int, mtime: int, read: Callable
+    ) -> Tuple:
+        # a file is unchanged if its size and modification time, or else its content hash, are the same as in the previous release
+        entry, data = {"size": size, "mtime": mtime}, None
+        old = previous.get(key)
+        if old is not None and old["size"] == size:
+            if old["mtime"] != mtime:
+                data = read()
+            if data is None or hashlib.sha256(data).hexdigest() == old["hash"]:
+                return {**old, **entry}, None
+        return entry, data
+
+    def sources(self, files: List[str], previous: Dict = {}) -> Iterator[Tuple]:
+        """Lists the structure files, including the members of archives, and checks them against the manifest of a previous release.
+        Archive members are read here, while plain files are left to the workers unless their hash has to be checked.
+
+        Parameters
+        ----------
+        files : List[str]
+            The structure files and archives, see ``files``.
+        previous : Dict, optional
+            The manifest of the previous release, by default {}
+
+        Yields
+        ------
+        Tuple
+            The manifest key (the path relative to the adapter path, and the member name for archives), the name to process, the content if it was read, and the manifest entry. The entry contains the hash and protein ID of the previous release if the file is unchanged.
+        """
+        base = self.path if os.path.isdir(self.path) else self.path.parent
+        for file in files:
+            key = os.path.relpath(file, base)
+            if is_archive(file):
+                for name, size, mtime, read in read_archive(file):
+                    entry, data = self._entry(
+                        previous, f"{key}:{name}", size, mtime, read
+                    )
+                    if data is None and "hash" not in entry:
+                        data = read()
+                    yield f"{key}:{name}", name, data, entry
+            else:
+                stat = os.stat(file)
+                read = Path(file).read_bytes
+                entry, data = self._entry(
+                    previous, key, stat.st_size, stat.st_mtime_ns, read
+                )
+                yield key, file, data, entry
+
+    def download(self, previous: Union[str, Path, None] = None) -> ProteinGenerator:
+        """Processes all structure files of the directory, including the ones in archives. Files that fail to process are logged and skipped.
+        The returned generator has a manifest mapping every file (by path, size, modification time and content hash) to the ID of its protein, which ``Dataset.save`` stores next to the proteins. Modifiers applied in ``release`` have to pass the manifest on (see ``Modifier``). If the directory of the previous release is given, only files that were added or changed since are processed, and the proteins of unchanged files are copied from the previous release by their ID. Unchanged files whose protein is not in the previous release, e.g. because a modifier removed it, or whose ID is not unique, are processed again. Copied proteins are the ones stored by the previous release, including the fields set by modifiers, and pass through the modifiers again.
+
+        .. code:: python
+
+            def release(self, version=None):
+                previous = self.latest_local_version
+                proteins = LocalAdapter(path).download(previous and self.root / previous)
+                return self.save(proteins, version)
+
+        Parameters
+        ----------
+        previous : Union[str, Path, None], optional
+            The directory of the previous dataset version, by default None (process all files)
+
+        Returns
+        -------
+        ProteinGenerator
+            The proteins. Its length is the number of files, where a compressed tar archive counts as one file since listing its members would decompress it an extra time. The length is therefore only an estimate of the number of proteins, for progress bars.
+        """
+        files = self.files()
+        length = sum(
+            len(archive_members(f)) if is_archive(f) and not is_compressed_tar(f) else 1
+            for f in files
+        )
+        manifest, reader, old = {}, None, {}
+        if previous is not None and os.path.exists(Path(previous) / "manifest.json"):
+            reader = VersionReader(previous)
+            old = load(Path(previous) / "manifest.json")
+            # files can only be matched to proteins that were stored, by a unique ID
+            counts = Counter(entry.get("ID") for entry in old.values())
+            usable = {
+                key: entry
+                for key, entry in old.items()
+                if counts[entry.get("ID")] == 1 and entry.get("ID") in reader.ids
+            }
+            if len(old) > 0 and len(usable) == 0:
+                warn(
+                    f"The manifest of {previous} does not match any stored protein. Processing all files."
+                )
+            old = usable
+        elif previous is not None:
+            warn(
+                f"{previous} has no manifest, e.g. because a modifier did not pass it on. Processing all files."
+            )
+
+        def chunks():
+            iterator = self.sources(files, old)
+            while chunk := list(islice(iterator, self.chunk_size)):
+                yield chunk
 
         def generator():
-            for file in files[:10]:
-                protein = Processor.process(file)
-                yield protein
+            if self.num_workers > 0:
+                results = parallel_map(
+                    _process_files, chunks(), self.num_workers, ordered=self.ordered
+                )
+            else:
+                results = map(_process_files, chunks())
+            for chunk in results:
+                for key, protein, entry, failure in chunk:
+                    if failure is not None:
+                        warn(f"Skipping {key}: {failure}")
+                        continue
+                    if protein is None:
+                        protein = reader[entry["ID"]]
+                    manifest[key] = {**entry, "ID": protein["ID"]}
+                    yield protein
 
-        return ProteinGenerator(generator(), len(files), {})
+        return ProteinGenerator(generator(), length, {}, manifest)
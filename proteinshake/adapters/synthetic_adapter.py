@@ -4,19 +4,61 @@ import numpy as np
 
 
 class SyntheticAdapter(Adapter):
+    """Generates random proteins, e.g. for tests and benchmarks.
+    Proteins are generated in vectorised chunks, such that millions of them can be streamed quickly. The coordinates are random walks with the distance of consecutive C-alpha atoms.
+    """
 
-    def download(self, n=10):
-        rng = np.random.default_rng(42)
-        proteins = (
-            {
-                "ID": f"protein_{i}",
-                "coords": rng.integers(0, 100, size=(300, 3)).tolist(),
-                "sequence": str(
-                    "".join(rng.choice(list(amino_acid_alphabet)) for _ in range(300))
-                ),
-                "label": int(rng.random() * 100),
-                "split": str(rng.choice(["train", "test", "val"])),
-            }
-            for i in range(10)
+    def download(self, n=10, length=300, random_seed=42, chunk_size=4096):
+        """Generates the proteins.
+
+        Parameters
+        ----------
+        n:
+            The number of proteins, by default 10
+        length:
+            The number of residues of every protein, by default 300. If None, the lengths follow a log-normal distribution resembling protein chains in the PDB (median 250 residues, between 30 and 2000).
+        random_seed:
+            The random seed, by default 42
+        chunk_size:
+            The number of proteins generated at once, by default 4096
+
+        Returns
+        -------
+        ProteinGenerator
+            The proteins, with the fields ID, coords, sequence, label and split (80% train, 10% test, 10% val).
+        """
+        return ProteinGenerator(
+            self._generate(n, length, random_seed, chunk_size), n, {}
         )
-        return ProteinGenerator(proteins, 10, {})
+
+    def _generate(self, n, length, random_seed, chunk_size):
+        rng = np.random.default_rng(random_seed)
+        alphabet = np.frombuffer(amino_acid_alphabet.encode(), dtype=np.uint8)
+        splits = np.array(["train", "test", "val"])
+        for first in range(0, n, chunk_size):
+            size = min(chunk_size, n - first)
+            if length is None:
+                lengths = rng.lognormal(np.log(250), 0.6, size=size)
+                lengths = np.clip(lengths, 30, 2000).astype(np.int64)
+            else:
+                lengths = np.full(size, length, dtype=np.int64)
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            labels = rng.integers(100, size=size).tolist()
+            split = rng.choice(splits, size=size, p=[0.8, 0.1, 0.1]).tolist()
+            sequences = alphabet[rng.integers(len(alphabet), size=offsets[-1])]
+            sequences = sequences.tobytes().decode()
+            # random walks with steps of 3.8 angstrom, restarted at the origin for every protein
+            steps = rng.normal(size=(offsets[-1], 3)).astype(np.float32)
+            steps *= 3.8 / np.linalg.norm(steps, axis=1, keepdims=True)
+            steps[offsets[:-1]] = 0
+            coords = np.cumsum(steps, axis=0)
+            coords -= np.repeat(coords[offsets[:-1]], lengths, axis=0)
+            for i in range(size):
+                start, stop = offsets[i], offsets[i + 1]
+                yield {
+                    "ID": f"protein_{first + i}",
+                    "coords": coords[start:stop].tolist(),
+                    "sequence": sequences[start:stop],
+                    "label": labels[i],
+                    "split": split[i],
+                }
@@ -2,20 +2,88 @@ from abc import ABC, abstractmethod
 from datetime import datetime
 from pathlib import Path
 import os, itertools
-from typing import Union
-from fastavro import writer as avro_writer, reader as avro_reader
+from typing import Union, List, Dict
+from fastavro import reader as avro_reader
+from fastavro.write import Writer as AvroWriter
+import numpy as np
 from .utils import (
     ProteinGenerator,
     save,
     load,
     dict_to_avro_schema,
+    to_avro_record,
+    read_avro_block,
+    project_avro_schema,
+    parallel_map,
+    ColumnarWriter,
+    ColumnarReader,
+    BlockStatistics,
+    Predicate,
     info,
+    warn,
     error,
     LOCATIONS,
     current_date,
+    fingerprint,
 )
 
 
+def _read_block(args):
+    path, header_size, offset, size, reader_schema, predicate, columns = args
+    proteins = read_avro_block(
+        path / "proteins.avro", header_size, offset, size, reader_schema
+    )
+    if predicate is not None:
+        proteins = [p for p in proteins if predicate(p)]
+    if columns is not None:
+        proteins = [{name: p[name] for name in columns} for p in proteins]
+    return proteins
+
+
+class VersionReader:
+    """Reads the proteins of a saved dataset version by ID or position, e.g. to copy them into a new version.
+    Uses the columnar store if it exists. Otherwise the avro block of the requested protein is decoded, and the last decoded block is kept, such that reading positions in order decodes every block once.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The directory of the dataset version.
+        """
+        self.path = Path(path)
+        self.index = load(self.path / "index.json")
+        self.ids = load(self.path / "ids.json")
+        self.store = (
+            ColumnarReader(self.path / "columns")
+            if ColumnarReader.exists(self.path / "columns")
+            else None
+        )
+        self.starts = np.asarray([block["start"] for block in self.index["blocks"]])
+        self.block, self.records = None, None
+
+    def __len__(self) -> int:
+        return self.index["num_proteins"]
+
+    def __getitem__(self, key: Union[str, int]) -> Dict:
+        row = self.ids[key] if isinstance(key, str) else key
+        if self.store is not None:
+            return self.store[row]
+        b = int(np.searchsorted(self.starts, row, side="right")) - 1
+        if b != self.block:
+            block = self.index["blocks"][b]
+            self.records = read_avro_block(
+                self.path / "proteins.avro",
+                self.index["header_size"],
+                block["offset"],
+                block["size"],
+            )
+            self.block = b
+        return self.records[row - self.index["blocks"][b]["start"]]
+
+
 class Dataset(ABC):
     """
     Abstract class to define the dataset functionality.
@@ -107,9 +175,16 @@ class Dataset(ABC):
         return None
 
     def save(
-        self, proteins: ProteinGenerator, version: Union[str, None] = None
+        self,
+        proteins: ProteinGenerator,
+        version: Union[str, None] = None,
+        columnar: bool = True,
+        block_size: int = 256,
     ) -> None:
         """Saves the ProteinGenerator as version to disk.
+        The proteins are stored in ``proteins.avro``, and optionally in a memory-mappable columnar layout in ``columns/`` next to it.
+        The avro file is written in blocks of ``block_size`` proteins, whose byte offsets and statistics (see ``BlockStatistics``) are stored in ``index.json`` for random access and filtering. Protein IDs are mapped to their position in ``ids.json``.
+        If the generator has a manifest of its source files (see ``LocalAdapter``), it is stored in ``manifest.json``, such that the next release can reuse the proteins of unchanged files.
 
         Parameters
         ----------
@@ -117,37 +192,184 @@ class Dataset(ABC):
             The protein generator.
         version : Union[str, None], optional
             The version name, by default None
+        columnar : bool, optional
+            Whether to also write the columnar store, by default True
+        block_size : int, optional
+            The number of proteins per avro block, by default 256
         """
         version = version or current_date()
         if os.path.exists(self.root / version):
             error(f"Version {version} alreadt exists!")
         num_proteins = len(proteins)
+        # filled while the proteins are written
+        manifest = getattr(proteins, "manifest", None)
         self.path = self.root / version
         save(proteins.assets, self.path / "assets.json")
-        proteins, tee = itertools.tee(proteins)
-        schema = dict_to_avro_schema(next(tee))
+        # only the first protein is buffered to guess the schema
+        proteins = iter(proteins)
+        first = next(proteins)
+        proteins = itertools.chain([first], proteins)
+        schema = dict_to_avro_schema(first)
         os.makedirs(self.path, exist_ok=True)
+        columns = ColumnarWriter(self.path / "columns") if columnar else None
+
+        def records():
+            nonlocal columns
+            for protein in proteins:
+                if columns is not None:
+                    try:
+                        columns.write(protein)
+                    except ValueError as e:
+                        warn(f"Cannot store proteins in columnar format: {e}")
+                        columns.abort()
+                        columns = None
+                yield protein
+
+        blocks, ids, statistics = [], {}, BlockStatistics()
         with open(self.path / "proteins.avro", "wb") as file:
-            avro_writer(
+            # blocks are only written when flushed explicitly
+            writer = AvroWriter(
                 file,
                 schema,
-                proteins,
                 metadata={"number_of_proteins": str(num_proteins)},
+                sync_interval=2**62,
             )
+            header_size = file.tell()
+
+            def flush(stop):
+                count = writer.block_count
+                if count == 0:
+                    return
+                offset = file.tell()
+                writer.flush()
+                blocks.append(
+                    {
+                        "offset": offset,
+                        "size": file.tell() - offset,
+                        "start": stop - count,
+                        "stop": stop,
+                        "stats": statistics.pop(),
+                    }
+                )
+
+            num_written = 0
+            for protein in records():
+                if "ID" in protein:
+                    ids[protein["ID"]] = num_written
+                writer.write(to_avro_record(protein))
+                statistics.update(protein)
+                num_written += 1
+                if writer.block_count == block_size:
+                    flush(num_written)
+            flush(num_written)
+        if columns is not None:
+            columns.close()
+        save(
+            {"num_proteins": num_written, "header_size": header_size, "blocks": blocks},
+            self.path / "index.json",
+        )
+        save(ids, self.path / "ids.json")
+        if manifest is not None:
+            save(manifest, self.path / "manifest.json")
         return version
 
-    @property
-    def proteins(self) -> ProteinGenerator:
+    def proteins(
+        self,
+        columns: Union[List[str], None] = None,
+        where: Union[Dict, None] = None,
+        num_workers: int = 0,
+        ordered: bool = True,
+    ) -> ProteinGenerator:
         """Return the ProteinGenerator of the dataset.
+        If the columnar store exists, array fields are returned as read-only numpy views into the memory-mapped columns. Otherwise the proteins are decoded from ``proteins.avro``, optionally block by block in a process pool.
+
+        Parameters
+        ----------
+        columns : Union[List[str], None], optional
+            The fields to include in the protein dictionaries, by default None (all fields). Other fields are skipped without being materialized.
+        where : Union[Dict, None], optional
+            Conditions the proteins have to satisfy, e.g. ``{"split": "train", "length": (50, 500)}``. See ``Predicate`` for the syntax. Blocks whose statistics rule out a match are skipped without reading them. By default None (all proteins)
+        num_workers : int, optional
+            The number of processes decoding avro blocks in parallel, by default 0 (decode in the calling process)
+        ordered : bool, optional
+            Whether to yield proteins in their stored order when decoding in parallel, by default True
 
         Returns
         -------
         ProteinGenerator
-            Iterator over protein dictionaries.
+            Iterator over protein dictionaries. When filtering, its length is the number of proteins in the blocks that were not skipped, an upper bound of the number of matches.
         """
+        if not self.indexed:
+            return self._sequential_proteins(columns, where)
+        index = self.index
+        blocks, total = index["blocks"], index["num_proteins"]
+        predicate, read_columns = None, columns
+        if where:
+            predicate = Predicate(where, self._fields())
+            blocks = [b for b in blocks if predicate.may_match(b.get("stats", {}))]
+            total = sum(block["stop"] - block["start"] for block in blocks)
+            if columns is not None:
+                read_columns = list(dict.fromkeys([*columns, *predicate.fields]))
+        assets = (
+            load(self.path / "assets.json")
+            if os.path.exists(self.path / "assets.json")
+            else {}
+        )
+
+        if ColumnarReader.exists(self.path / "columns"):
+            store = ColumnarReader(self.path / "columns", read_columns)
+
+            def columnar_reader():
+                for block in blocks:
+                    for row in range(block["start"], block["stop"]):
+                        protein = store[row]
+                        if predicate(protein):
+                            yield {name: protein[name] for name in columns or protein}
+
+            generator = iter(store) if predicate is None else columnar_reader()
+            return ProteinGenerator(generator, total, assets)
+        reader_schema = self._reader_schema(read_columns)
+
+        def reader():
+            with open(self.path / "proteins.avro", "rb") as file:
+                for x in avro_reader(file, reader_schema):
+                    yield x
+
+        def block_reader():
+            args = (
+                (
+                    self.path,
+                    index["header_size"],
+                    block["offset"],
+                    block["size"],
+                    reader_schema,
+                    predicate,
+                    None if read_columns is columns else columns,
+                )
+                for block in blocks
+            )
+            if num_workers > 0:
+                proteins = parallel_map(_read_block, args, num_workers, ordered=ordered)
+            else:
+                proteins = map(_read_block, args)
+            for block in proteins:
+                yield from block
+
+        if predicate is None and num_workers == 0:
+            return ProteinGenerator(reader(), total, assets)
+        return ProteinGenerator(block_reader(), total, assets)
+
+    def _sequential_proteins(
+        self, columns: Union[List[str], None], where: Union[Dict, None]
+    ) -> ProteinGenerator:
+        # versions saved before the block index only support a sequential scan
+        predicate = Predicate(where, self._fields()) if where else None
+        read_columns = columns
+        if predicate is not None and columns is not None:
+            read_columns = list(dict.fromkeys([*columns, *predicate.fields]))
+        reader_schema = self._reader_schema(read_columns)
         with open(self.path / "proteins.avro", "rb") as file:
             total = int(avro_reader(file).metadata["number_of_proteins"])
-
         assets = (
             load(self.path / "assets.json")
             if os.path.exists(self.path / "assets.json")
@@ -156,11 +378,124 @@ class Dataset(ABC):
 
         def reader():
             with open(self.path / "proteins.avro", "rb") as file:
-                for x in avro_reader(file):
-                    yield x
+                for x in avro_reader(file, reader_schema):
+                    if predicate is None:
+                        yield x
+                    elif predicate(x):
+                        yield {name: x[name] for name in columns or x}
 
         return ProteinGenerator(reader(), total, assets)
 
+    def _fields(self) -> List[str]:
+        with open(self.path / "proteins.avro", "rb") as file:
+            return [
+                field["name"] for field in avro_reader(file).writer_schema["fields"]
+            ]
+
+    def _reader_schema(self, columns: Union[List[str], None]) -> Union[Dict, None]:
+        if columns is None:
+            return None
+        with open(self.path / "proteins.avro", "rb") as file:
+            return project_avro_schema(avro_reader(file).writer_schema, columns)
+
+    @property
+    def indexed(self) -> bool:
+        """Whether the version has the block index of ``proteins.avro``. Versions saved by earlier releases of ProteinShake do not, and can only be read sequentially."""
+        return os.path.exists(self.path / "index.json")
+
+    @property
+    def index(self) -> Dict:
+        """The block index of ``proteins.avro``, as written by ``save``."""
+        if not self.indexed:
+            raise FileNotFoundError(
+                f"{self.__class__.__name__} version {self.path.name} was saved without a block index and only supports iterating over proteins(). Release the version again to access proteins by ID or position."
+            )
+        return load(self.path / "index.json")
+
+    def _rows(self, keys: List[Union[str, int]]) -> np.ndarray:
+        if any(isinstance(key, str) for key in keys):
+            if getattr(self, "_ids_path", None) != self.path:
+                self._ids, self._ids_path = load(self.path / "ids.json"), self.path
+        try:
+            rows = [self._ids[key] if isinstance(key, str) else key for key in keys]
+        except KeyError as e:
+            raise KeyError(f"Protein {e} not found in {self.__class__.__name__}.")
+        return np.asarray(rows, dtype=np.int64)
+
+    def get(
+        self, ids: List[Union[str, int]], columns: Union[List[str], None] = None
+    ) -> List[Dict]:
+        """Returns a list of proteins by ID or position, without scanning the dataset.
+        With the columnar store, this is a constant-time lookup per protein. Otherwise only the avro blocks containing the requested proteins are decoded.
+
+        Parameters
+        ----------
+        ids : List[Union[str, int]]
+            Protein IDs (str) or positions (int) in the dataset.
+        columns : Union[List[str], None], optional
+            The fields to include in the protein dictionaries, by default None (all fields)
+
+        Returns
+        -------
+        List[Dict]
+            The protein dictionaries, in the order of ``ids``.
+        """
+        columnar = ColumnarReader.exists(self.path / "columns")
+        # raises for versions without a block index before the IDs are looked up
+        index = None if columnar else self.index
+        rows = self._rows(list(ids))
+        if columnar:
+            store = ColumnarReader(self.path / "columns", columns)
+            rows[rows < 0] += len(store)
+            if np.any((rows < 0) | (rows >= len(store))):
+                raise IndexError("Protein index out of range.")
+            return [store[row] for row in rows]
+        rows[rows < 0] += index["num_proteins"]
+        if np.any((rows < 0) | (rows >= index["num_proteins"])):
+            raise IndexError("Protein index out of range.")
+        reader_schema = self._reader_schema(columns)
+        starts = np.asarray([block["start"] for block in index["blocks"]])
+        block_ids = np.searchsorted(starts, rows, side="right") - 1
+        records = {}
+        for b in np.unique(block_ids):
+            block = index["blocks"][b]
+            records[b] = read_avro_block(
+                self.path / "proteins.avro",
+                index["header_size"],
+                block["offset"],
+                block["size"],
+                reader_schema,
+            )
+        return [
+            records[b][row - index["blocks"][b]["start"]]
+            for b, row in zip(block_ids, rows)
+        ]
+
+    def __getitem__(self, key: Union[str, int]) -> Dict:
+        """Returns a single protein by ID (str) or position (int). See ``get``."""
+        return self.get([key])[0]
+
+    def hash(self) -> str:
+        """Computes a hash value identifying the dataset version, independent of where it is stored.
+        Includes the sync marker of ``proteins.avro``, which is drawn randomly every time a version is saved, such that a version that is released again under the same name gets a new hash. Every avro block, and the header, ends with the sync marker, so it is read from the end of the file.
+
+        Returns
+        -------
+        str
+            A hash value.
+        """
+        with open(self.path / "proteins.avro", "rb") as file:
+            file.seek(-16, os.SEEK_END)
+            sync_marker = file.read(16)
+        return fingerprint(
+            [
+                self.__class__.__name__,
+                self.path.name,
+                os.path.getsize(self.path / "proteins.avro"),
+                sync_marker,
+            ]
+        )
+
     @abstractmethod
     def release(self, version: Union[str, None] = None) -> None:
         """Creates a new version of the dataset.
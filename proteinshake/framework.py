@@ -14,7 +14,7 @@ class Framework(ABC):
         Parameters
         ----------
         iterator : Tuple[Tuple[Any],Any]
-            The Xy-iterator of transformed proteins.
+            A function returning the Xy-iterator of transformed proteins. Takes the optional arguments ``partition`` and ``num_partitions`` (e.g. distributed ranks), and ``worker`` and ``num_workers`` (e.g. data loader workers), to iterate only a part of the data, and ``epoch`` to determine the shuffled order.
 
         Returns
         -------
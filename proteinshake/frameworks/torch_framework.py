@@ -1,17 +1,84 @@
 import torch
+import torch.distributed as dist
 import numpy as np
-from torch.utils.data import DataLoader, IterableDataset
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
 from proteinshake.transform import DataTransform
 from proteinshake.framework import Framework
 
 
+class ShardDataset(IterableDataset):
+    """Iterates the part of the data that belongs to the current data loader worker and distributed rank."""
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.epoch, self.batches = 0, 0
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (
+            (0, 1) if worker is None else (worker.id, worker.num_workers)
+        )
+        rank, world_size = 0, 1
+        if dist.is_available() and dist.is_initialized():
+            rank, world_size = dist.get_rank(), dist.get_world_size()
+        # ranks are padded to equally many items, while the workers of a rank split its items without padding
+        part, skip = self._resume(rank, world_size, num_workers)[worker_id]
+        return self.iterator(
+            partition=rank,
+            num_partitions=world_size,
+            epoch=self.epoch,
+            skip=skip,
+            worker=part,
+            num_workers=num_workers,
+        )
+
+    def _resume(self, rank, world_size, num_workers):
+        # the loader takes batches from the workers in turns, starting at worker 0 and passing over exhausted workers.
+        # to resume in order, the workers are rotated such that worker 0 takes the part that was next in turn.
+        if self.batches == 0:
+            return [(part, 0) for part in range(num_workers)]
+        counts = [
+            len(self.iterator.plan(rank, world_size, self.epoch, part, num_workers))
+            for part in range(num_workers)
+        ]
+        consumed, turn = [0] * num_workers, 0
+        for _ in range(min(self.batches, sum(counts))):
+            while consumed[turn] == counts[turn]:
+                turn = (turn + 1) % num_workers
+            consumed[turn] += 1
+            turn = (turn + 1) % num_workers
+        parts = [(turn + w) % num_workers for w in range(num_workers)]
+        return [(part, consumed[part]) for part in parts]
+
+
+class ShardDataLoader(DataLoader):
+    """A DataLoader that advances the epoch of its ``ShardDataset`` on every iteration, such that workers and ranks agree on the shuffled order.
+    The cursor of the iteration (epoch and consumed batches of this rank) is available from ``state_dict``, and ``load_state_dict`` resumes from it without loading the skipped batches. Workers of ``persistent_workers=True`` keep the epoch they were started with.
+    """
+
+    def set_epoch(self, epoch):
+        self.dataset.epoch, self.dataset.batches = epoch, 0
+
+    def state_dict(self):
+        return {"epoch": self.dataset.epoch, "batches": self.dataset.batches}
+
+    def load_state_dict(self, state):
+        self.dataset.epoch, self.dataset.batches = state["epoch"], state["batches"]
+
+    def __iter__(self):
+        iterator = super().__iter__()
+        # the workers copied the cursor, which is now advanced by the consumed batches
+        for batch in iterator:
+            self.dataset.batches += 1
+            yield batch
+        self.dataset.epoch, self.dataset.batches = self.dataset.epoch + 1, 0
+
+
 class TorchFrameworkTransform(Framework, DataTransform):
     def transform(self, X):
         return X
 
     def create_loader(self, iterator, **kwargs):
-        class Dataset(IterableDataset):
-            def __iter__(self):
-                return iterator()
-
-        return DataLoader(Dataset(), **kwargs)
+        # batches are assembled by the task loader already
+        kwargs.setdefault("batch_size", None)
+        return ShardDataLoader(ShardDataset(iterator), **kwargs)
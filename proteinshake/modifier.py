@@ -4,6 +4,7 @@ from proteinshake.utils import ProteinGenerator
 class Modifier:
     """
     Transforms a Collection. May be used to precompute splits or filter proteins.
+    The returned generator should pass on the ``assets`` and ``manifest`` of its input, such that ``Dataset.save`` stores them.
     """
 
     def __init__(self, *args, **kwargs) -> None:
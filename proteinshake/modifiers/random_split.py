@@ -31,7 +31,9 @@ class RandomSplit(Modifier):
                 protein["split"] = split
                 yield protein
 
-        return ProteinGenerator(generator(), len(proteins), proteins.assets)
+        return ProteinGenerator(
+            generator(), len(proteins), proteins.assets, proteins.manifest
+        )
 
     # this is just to keep the code around for multiple splits, which is currently not implemented downstream.
     def for_later(self, proteins):
@@ -51,4 +53,6 @@ class RandomSplit(Modifier):
                 protein["split"] = split
                 yield protein
 
-        return ProteinGenerator(generator(), len(proteins), proteins.assets)
+        return ProteinGenerator(
+            generator(), len(proteins), proteins.assets, proteins.manifest
+        )
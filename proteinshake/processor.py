@@ -1,7 +1,135 @@
+import re, gzip, bz2, lzma
 from pathlib import Path
 from typing import Union, Dict
+import numpy as np
 from biopandas.pdb import PandasPdb
 from biopandas.mmcif import PandasMmcif
+from proteinshake.utils import residue_letters
+
+# decompression functions by file extension
+_decompress = {".gz": gzip.decompress, ".bz2": bz2.decompress, ".xz": lzma.decompress}
+
+
+class EmptyStructureError(ValueError):
+    """Raised for structures without C-alpha atoms."""
+
+
+def _residues(names, numbers, insertions, chains, coords):
+    """Builds the residue arrays of a protein from its C-alpha atoms. Of consecutive atoms of the same residue (alternate locations), the first is kept. Raises an EmptyStructureError if there are no C-alpha atoms."""
+    if len(names) == 0:
+        raise EmptyStructureError("No C-alpha atoms.")
+    first = np.ones(len(names), dtype=bool)
+    first[1:] = (
+        (numbers[1:] != numbers[:-1])
+        | (insertions[1:] != insertions[:-1])
+        | (chains[1:] != chains[:-1])
+    )
+    names, numbers, chains, coords = (
+        np.char.strip(names[first]),
+        numbers[first],
+        chains[first],
+        coords[first],
+    )
+    unique, inverse = np.unique(names, return_inverse=True)
+    letters = np.array([residue_letters.get(name, "X") for name in unique.tolist()])
+    # chains are numbered in the order of their appearance
+    unique, first, inverse_chains = np.unique(
+        chains, return_index=True, return_inverse=True
+    )
+    order = np.argsort(first)
+    return {
+        "sequence": "".join(letters[inverse.ravel()].tolist()),
+        "coords": np.asarray(coords, dtype=np.float32).reshape(-1, 3),
+        "residue_number": np.asarray(numbers, dtype=np.int32),
+        "chain": np.argsort(order).astype(np.int32)[inverse_chains.ravel()],
+        "chain_ids": ",".join(unique[order].tolist()),
+    }
+
+
+def _parse_pdb(data: bytes) -> Dict:
+    """Parses the fixed-column ATOM records of the first model of a PDB file."""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buffer == ord("\n"))
+    starts = np.concatenate([[0], ends + 1])
+    ends = np.append(ends, len(buffer))
+
+    def columns(lines, start, stop):
+        # the bytes of the lines in a column range, as fixed-width strings
+        if np.any(ends[lines] - starts[lines] < stop):
+            raise ValueError("Truncated ATOM record.")
+        index = starts[lines, None] + np.arange(start, stop)
+        return np.ascontiguousarray(buffer[index]).view(f"S{stop - start}").ravel()
+
+    candidates = np.flatnonzero(ends - starts >= 6)
+    records = columns(candidates, 0, 6)
+    models = candidates[records == b"ENDMDL"]
+    atoms = candidates[records == b"ATOM  "]
+    if len(models) > 0:
+        atoms = atoms[atoms < models[0]]
+    atoms = atoms[columns(atoms, 12, 16) == b" CA "]
+    coords = columns(atoms, 30, 54).view("S8").reshape(-1, 3).astype(np.float32)
+    return _residues(
+        columns(atoms, 17, 20).astype(str),
+        columns(atoms, 22, 26).astype(np.int32),
+        columns(atoms, 26, 27),
+        columns(atoms, 21, 22).astype(str),
+        coords,
+    )
+
+
+_cif_token = re.compile(rb"'[^']*'(?=\s|$)|\"[^\"]*\"(?=\s|$)|\S+")
+
+
+def _parse_mmcif(data: bytes) -> Dict:
+    """Tokenises the ``_atom_site`` loop of an mmCIF file, and parses the ATOM records of its first model."""
+    lines = data.splitlines()
+    header = next(
+        (i for i, line in enumerate(lines) if line.startswith(b"_atom_site.")), None
+    )
+    if header is None:
+        raise ValueError("No _atom_site loop.")
+    fields, end = [], header
+    while end < len(lines) and lines[end].startswith(b"_atom_site."):
+        fields.append(lines[end][len(b"_atom_site.") :].strip().decode())
+        end += 1
+    start = end
+    while end < len(lines) and not lines[end].startswith((b"#", b"loop_", b"_")):
+        if lines[end].startswith(b";"):
+            raise ValueError("Multi-line values in the _atom_site loop.")
+        end += 1
+    block = b"\n".join(lines[start:end])
+    # quoted values (e.g. atom names with primes) need the slower tokenizer
+    quoted = b"'" in block or b'"' in block
+    tokens = _cif_token.findall(block) if quoted else block.split()
+    if len(tokens) % len(fields) != 0:
+        raise ValueError("Malformed _atom_site loop.")
+
+    def column(*names):
+        for name in names:
+            if name in fields:
+                return np.array(tokens[fields.index(name) :: len(fields)])
+        raise ValueError(f"Missing _atom_site column {names[0]}.")
+
+    atoms = (column("group_PDB") == b"ATOM") & (
+        column("label_atom_id", "auth_atom_id") == b"CA"
+    )
+    if "pdbx_PDB_model_num" in fields and len(tokens) > 0:
+        models = column("pdbx_PDB_model_num")
+        atoms &= models == models[0]
+    coords = np.stack(
+        [column(f"Cartn_{axis}")[atoms] for axis in "xyz"], axis=1
+    ).astype(np.float32)
+    return _residues(
+        column("label_comp_id", "auth_comp_id")[atoms].astype(str),
+        column("auth_seq_id", "label_seq_id")[atoms].astype(np.int32),
+        (
+            column("pdbx_PDB_ins_code")[atoms]
+            if "pdbx_PDB_ins_code" in fields
+            else np.zeros(atoms.sum(), dtype="S1")
+        ),
+        column("auth_asym_id", "label_asym_id")[atoms].astype(str),
+        coords,
+    )
 
 
 class Processor:
@@ -29,13 +157,37 @@ class Processor:
         return any(suffix in [".pdb", ".cif"] for suffix in suffixes)
 
     @classmethod
-    def process(self, path: Union[str, Path]) -> Dict:
+    def identifier(self, path: Union[str, Path]) -> str:
+        """The ID of a structure file, i.e. its name without the structure file and compression extensions.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The file path.
+
+        Returns
+        -------
+        str
+            The ID.
+        """
+        name = Path(path).name
+        for suffix in reversed(Path(name).suffixes):
+            if suffix not in [".pdb", ".cif", *_decompress]:
+                break
+            name = name[: -len(suffix)]
+        return name
+
+    @classmethod
+    def process(self, path: Union[str, Path], data: Union[bytes, None] = None) -> Dict:
         """Takes a protein structure file and returns a cleaned protein dictionary.
+        Compressed files (gzip, bzip2 or xz, e.g. ``1abc.pdb.gz``) are decompressed in memory. Other extensions after the structure file extension raise a ValueError, as do structures without C-alpha atoms.
 
         Parameters
         ----------
         path : Union[str, Path]
-            The file path
+            The file path, or the name of the file if ``data`` is given (e.g. an archive member)
+        data : Union[bytes, None], optional
+            The content of the file, by default None (read from ``path``)
 
         Returns
         -------
@@ -43,20 +195,67 @@ class Processor:
             A protein dictionary with ID, sequence, coordinates, and quality scores.
         """
         path = Path(path)
-        if ".pdb" in path.suffixes:
-            pdb = PandasPdb().read_pdb(str(path))
-            df = pdb.df["ATOM"]
-            sequence = "".join(pdb.amino3to1()["residue_name"].to_list())
-            x, y, z = df.x_coord.to_list(), df.y_coord.to_list(), df.z_coord.to_list()
-        elif ".cif" in path.suffixes:
-            pdb = PandasMmcif().read_mmcif(str(path))
-            df = pdb.df["ATOM"]
-            sequence = "".join(pdb.amino3to1()["auth_comp_id"].to_list())
-            x, y, z = df.Cartn_x.to_list(), df.Cartn_y.to_list(), df.Cartn_z.to_list()
-        return {
-            "ID": id,
-            "sequence": sequence,
-            "x": x,
-            "y": y,
-            "z": z,
-        }
+        if data is None:
+            with open(path, "rb") as file:
+                data = file.read()
+        if path.suffix in _decompress:
+            data = _decompress[path.suffix](data)
+        elif path.suffix not in [".pdb", ".cif"]:
+            raise ValueError(f"Unknown compression {path.suffix}.")
+        format = "pdb" if ".pdb" in path.suffixes else "cif"
+        return {"ID": self.identifier(path), **self.parse(data, format)}
+
+    @classmethod
+    def parse(self, data: bytes, format: str) -> Dict:
+        """Parses the residues of the first model of a structure, represented by their C-alpha atoms.
+        PDB records and mmCIF ``_atom_site`` loops are parsed directly from the bytes with numpy. Files the fast parser does not understand are parsed with biopandas. Structures without C-alpha atoms raise an ``EmptyStructureError``, a ValueError.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of the structure file.
+        format : str
+            The file format, 'pdb' or 'cif'.
+
+        Returns
+        -------
+        Dict
+            The one-letter ``sequence``, the float32 C-alpha ``coords`` of shape ``(residues, 3)``, the int32 ``residue_number`` and ``chain`` index of every residue, and the comma-separated ``chain_ids`` in the order of the chain indices.
+        """
+        try:
+            if format == "pdb":
+                return _parse_pdb(data)
+            return _parse_mmcif(data)
+        except EmptyStructureError:
+            # the fallback would not find any atoms either
+            raise
+        except ValueError:
+            return self._parse_biopandas(data, format)
+
+    @classmethod
+    def _parse_biopandas(self, data: bytes, format: str) -> Dict:
+        text = data.decode()
+        if format == "pdb":
+            pdb = PandasPdb().read_pdb_from_list(text.splitlines(keepends=True))
+            pdb.label_models()
+            df, models = pdb.df["ATOM"], "model_id"
+            names, numbers, chains = "residue_name", "residue_number", "chain_id"
+            insertions = "insertion"
+            x, y, z, atoms = "x_coord", "y_coord", "z_coord", "atom_name"
+        else:
+            # the mmCIF parser of biopandas only accepts the whole text, not a list of lines
+            df = PandasMmcif().read_mmcif_from_list(text).df["ATOM"]
+            models = "pdbx_PDB_model_num"
+            names, numbers, chains = "label_comp_id", "auth_seq_id", "auth_asym_id"
+            insertions = "pdbx_PDB_ins_code"
+            x, y, z, atoms = "Cartn_x", "Cartn_y", "Cartn_z", "label_atom_id"
+        if len(df) > 0:
+            df = df[df[models] == df[models].iloc[0]]
+        df = df[df[atoms] == "CA"]
+        return _residues(
+            df[names].to_numpy().astype(str),
+            df[numbers].to_numpy().astype(np.int32),
+            df[insertions].to_numpy().astype(str),
+            df[chains].to_numpy().astype(str),
+            df[[x, y, z]].to_numpy(),
+        )
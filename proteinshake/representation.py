@@ -6,4 +6,17 @@ class Representation(ABC):
     Abstract class for a representation. Used as Mixin with a Transform.
     """
 
-    pass
+    def collate(self, Xy):
+        """Combines the items of a loaded batch, e.g. by padding them to arrays of equal shape. Called by the loader before the stochastic transforms.
+
+        Parameters
+        ----------
+        Xy : Tuple
+            A batch of X and y arrays.
+
+        Returns
+        -------
+        Tuple
+            The collated batch.
+        """
+        return Xy
@@ -4,5 +4,51 @@ import numpy as np
 
 
 class PointRepresentationTransform(Representation, DataTransform):
+    """Represents a protein by the coordinates of its residues.
+    In the 'array' mode, a batch is an array of shape ``(batch, ..., length, 3)`` if all proteins have the same length, otherwise an object array of coordinate arrays. This also holds for batches across shards: a shard of proteins of equal length is stored dense, and batches with proteins of other shards fall back to object arrays.
+    In the 'padded' mode, a batch is a tuple of float32 coordinates padded to the longest protein, and a boolean mask of the residues.
+    In the 'packed' mode, a batch is a tuple of the concatenated float32 coordinates and the offsets of the proteins (CSR style).
+    Shards of proteins of different lengths are stored as packed coordinates in all modes.
+    """
+
+    modes = ["array", "padded", "packed"]
+
+    def __init__(self, mode="array"):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown mode {mode}, use one of {self.modes}.")
+        self.mode = mode
+
     def transform(self, X):
-        return np.asarray([protein["coords"] for protein in X])
+        coords = [np.asarray(protein["coords"], dtype=np.float32) for protein in X]
+        if self.mode == "array" and len({c.shape for c in coords}) == 1:
+            return np.stack(coords)
+        # an object array of coordinate arrays, which is stored as values and offsets
+        result = np.empty(len(coords), dtype=object)
+        for i, c in enumerate(coords):
+            result[i] = c
+        return result
+
+    def collate(self, Xy):
+        X, y = Xy
+        if self.mode == "array":
+            return X, y
+        items = X.ravel()
+        lengths = np.asarray([len(item) for item in items], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        values = (
+            np.concatenate(items).astype(np.float32, copy=False)
+            if len(items) > 0
+            else np.empty((0, 3), dtype=np.float32)
+        )
+        if self.mode == "packed":
+            return (values, offsets), y
+        # scatter the packed values into the padded array
+        longest = int(lengths.max(initial=0))
+        protein = np.repeat(np.arange(len(items)), lengths)
+        residue = np.arange(len(values)) - np.repeat(offsets[:-1], lengths)
+        coords = np.zeros((len(items), longest, *values.shape[1:]), dtype=np.float32)
+        mask = np.zeros((len(items), longest), dtype=bool)
+        coords[protein, residue] = values
+        mask[protein, residue] = True
+        shape = X.shape
+        return (coords.reshape(*shape, *coords.shape[1:]), mask.reshape(*shape, -1)), y
@@ -1,12 +1,15 @@
-from typing import Iterator, Tuple, Dict, Any
-from proteinshake.utils import ProteinGenerator
+from typing import Iterator, Tuple, Dict, Any, List, Union
+from proteinshake.utils import ProteinGenerator, fingerprint, init_arguments
 
 
 class Target:
     """
     Abstract class for reshaping a dataset into the correct data-target structure for a task.
+    Set ``columns`` to the protein fields the target and downstream transforms need, such that the other fields are not read from disk.
     """
 
+    columns: Union[List[str], None] = None
+
     def __call__(self, dataset: ProteinGenerator) -> Iterator[Tuple[Tuple[Dict], Any]]:
         """Takes a ProteinGenerator and returns an Xy-iterator whose elements are ``((X1,X2,...), y)`` pairs of data tuples and targets.
 
@@ -22,3 +25,13 @@ class Target:
 
         """
         raise NotImplementedError
+
+    def hash(self) -> str:
+        """Computes a hash value encoding the class name and instantiation arguments.
+
+        Returns
+        -------
+        str
+            A hash value.
+        """
+        return fingerprint([str(self.__class__), init_arguments(self)])
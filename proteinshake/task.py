@@ -1,14 +1,42 @@
 from typing import Union, List, Any, Dict
-import numpy as np
-import os, itertools
+import os, shutil
 from pathlib import Path
 from functools import partial
+from contextlib import nullcontext, ExitStack
+from concurrent.futures import ProcessPoolExecutor
 from proteinshake.target import Target
 from proteinshake.metric import Metric
 from proteinshake.transform import Transform, Compose, IdentityTransform
-from proteinshake.utils import sharded, save_shards, load, warn, LOCATIONS
+from proteinshake.utils import (
+    ShardWriter,
+    CacheManager,
+    ShardLoader,
+    Stats,
+    ProteinGenerator,
+    measure,
+    measured,
+    is_complete,
+    fingerprint,
+    save,
+    load,
+    LOCATIONS,
+)
 from numpy import ndarray
 
+# increment when the layout of cached shards changes
+CACHE_VERSION = 5
+
+
+class _Partition:
+    """Re-iterable view of the items of one split of an Xy-iterator factory."""
+
+    def __init__(self, Xy, split):
+        self.Xy = Xy
+        self.split = split
+
+    def __iter__(self):
+        return (item for item in self.Xy() if item[0][0]["split"] == self.split)
+
 
 class Task:
     """A task is defined by a dataset, a target, and a set of metrics.
@@ -24,53 +52,210 @@ class Task:
         self,
         root: Union[str, Path] = LOCATIONS.tasks,
         shard_size: int = 1024,
+        cache_budget: Union[int, None] = None,
+        profile: bool = False,
     ) -> None:
+        """
+
+        Parameters
+        ----------
+        root : Union[str, Path], optional
+            The directory of the task caches, by default ``LOCATIONS.tasks``
+        shard_size : int, optional
+            The number of items per shard, by default 1024
+        cache_budget : Union[int, None], optional
+            The maximum total size of the transform caches in bytes, by default None (unlimited)
+        profile : bool, optional
+            Whether to record the time, throughput and peak memory of every stage of ``transform`` and the loaders in ``self.stats``, by default False. The report is saved as JSON next to the cache directory, after ``transform`` and after every epoch of a loader.
+        """
         self.root = Path(root) / self.__class__.__name__
         os.makedirs(self.root, exist_ok=True)
         self.shard_size = shard_size
+        self.cache = CacheManager(self.root.parent, cache_budget)
+        self.stats = Stats() if profile else None
 
-    def transform(self, *transforms: List[Transform]) -> None:
+    def transform(
+        self,
+        *transforms: List[Transform],
+        num_workers: int = 0,
+        force: bool = False,
+        verify: bool = False,
+    ) -> None:
         """Applies a series of transforms to the dataset, including the target transform.
         Transformes are composed, and the deterministic part is saved to disk.
         Also realizes the split assignments and prepares the dataloaders.
+        The data is streamed twice at most: once to fit the transforms on the 'train' split (only if any transform needs fitting), and once to route every item to the shards of its split. At most one shard per split is kept in memory.
+        The fitted state and the shards are cached under content-addressed keys (see ``cache_key``), such that caches can be shared across runs, users and machines. The output of every deterministic transform is cached separately, and a chain resumes from its longest cached prefix, e.g. when only the last transform changed. Incomplete caches are resumed by only computing the missing or corrupt shards. Least recently used caches are evicted when exceeding the ``cache_budget`` of the task.
 
         Parameters
         ----------
         transforms : List[Transform]
             A number of transforms to be applied to the dataset.
+        num_workers : int, optional
+            The number of processes applying the deterministic transforms and saving the shards, by default 0 (in the calling process). The transforms need to be picklable.
+        force : bool, optional
+            Whether to discard the cache and recompute everything, by default False
+        verify : bool, optional
+            Whether to verify the checksums of cached shards instead of only their sizes, by default False
         """
-        Xy = self.target(self.dataset.proteins)
-        self.transform = Compose(*[self.augmentation, *transforms])
-        # cache from here
-        Xy, tee = itertools.tee(Xy)
-        partition = filter(lambda item: item[0][0]["split"] == "train", tee)
-        self.transform.fit(partition)
-        for split_name in ["train", "test", "val"]:
-            Xy, tee = itertools.tee(Xy)
-            partition = filter(lambda item: item[0][0]["split"] == split_name, tee)
-            partition = sharded(partition, shard_size=self.shard_size)
-            data_transformed = (
-                self.transform.deterministic_transform(shard) for shard in partition
-            )
-            save_shards(
-                data_transformed,
-                self.root / split_name / self.transform.hash() / "shards",
+        columns = self.target.columns
+        if columns is not None:
+            columns = list(dict.fromkeys([*columns, "split"]))
+
+        def Xy():
+            proteins = self.dataset.proteins(columns=columns)
+            if self.stats is None:
+                return self.target(proteins)
+            proteins = ProteinGenerator(
+                measured(proteins, "decode"), len(proteins), proteins.assets
             )
+            return measured(self.target(proteins), "target")
+
+        with self.stats or nullcontext():
+            self._transform(Xy, transforms, num_workers, force, verify)
+        if self.stats is not None:
+            self.stats.path = self.root / f"{self.cache_path.name}.stats.json"
+            self.stats.save()
+        for split_name in ["train", "test", "val"]:
             setattr(
                 self, f"{split_name}_loader", partial(self.loader, split=split_name)
             )
         return self
 
+    def _transform(self, Xy, transforms, num_workers, force, verify):
+        self.transform = Compose(*[self.augmentation, *transforms])
+        state_path = self.root / "states" / f"{self.cache_key()}.pkl"
+        if force and os.path.exists(state_path):
+            os.remove(state_path)
+        if os.path.exists(state_path):
+            self.transform.load_state_dict(load(state_path))
+        else:
+            with measure("fit"):
+                self.transform.fit(_Partition(Xy, "train"))
+            save(self.transform.state_dict(), state_path)
+        stages = self._stages()
+        if force:
+            for stage_path, _ in stages:
+                shutil.rmtree(stage_path, ignore_errors=True)
+        self.cache_path = stages[-1][0]
+        incomplete = {}
+        for split_name in ["train", "test", "val"]:
+            split_stages = [
+                (stage_path / split_name / "shards", function)
+                for stage_path, function in stages
+            ]
+            if not is_complete(split_stages[-1][0], verify):
+                incomplete[split_name] = split_stages
+        if len(incomplete) > 0:
+            self._write_shards(Xy, incomplete, num_workers, verify)
+        for stage_path, _ in stages:
+            self.cache.touch(stage_path)
+        self.cache.evict(keep=[stage_path for stage_path, _ in stages])
+
+    def _stages(self):
+        # a stage ends after every deterministic transform, except for identities which are merged into the next stage
+        transforms = self.transform.deterministic_transforms
+        stops = [
+            stop
+            for stop, transform in enumerate(transforms, 1)
+            if not isinstance(transform, IdentityTransform)
+        ]
+        stops = sorted({*stops, len(transforms)})
+        return [
+            (
+                self.root / self.cache_key(fitted=True, stage=stop),
+                (
+                    partial(
+                        self.transform.deterministic_transform, start=start, stop=stop
+                    )
+                    if stop > start
+                    else None
+                ),
+            )
+            for start, stop in zip([0, *stops], stops)
+        ]
+
+    def cache_key(self, fitted: bool = False, stage: Union[int, None] = None) -> str:
+        """Computes the key of the transform cache from the dataset version, the target, the configuration of the deterministic transforms, and the shard size.
+
+        Parameters
+        ----------
+        fitted : bool, optional
+            Whether to include a digest of the fitted state of the transforms, by default False
+        stage : Union[int, None], optional
+            Only include the first ``stage`` deterministic transforms, by default None (all of them)
+
+        Returns
+        -------
+        str
+            A hash value.
+        """
+        key = [
+            CACHE_VERSION,
+            self.dataset.hash(),
+            self.target.hash(),
+            self.transform.hash(stage),
+            self.shard_size,
+        ]
+        if fitted:
+            key.append(self.transform.state_hash(stage))
+        return fingerprint(key)
+
+    def _write_shards(self, Xy, stages, num_workers, verify):
+        executor = ProcessPoolExecutor(num_workers) if num_workers > 0 else None
+        # the writers are closed when all items are routed, or aborted if a transform fails
+        try:
+            with ExitStack() as stack:
+                writers = {
+                    split_name: stack.enter_context(
+                        ShardWriter(
+                            split_stages,
+                            self.shard_size,
+                            executor=executor,
+                            max_pending=2 * num_workers,
+                            verify=verify,
+                            stats=self.stats,
+                        )
+                    )
+                    for split_name, split_stages in stages.items()
+                }
+                routed = {}
+                for split_name, writer in writers.items():
+                    # resume from the last complete stage if there is one, otherwise route the items
+                    complete = [
+                        path
+                        for path, _ in stages[split_name][:-1]
+                        if is_complete(path, verify)
+                    ]
+                    if complete:
+                        writer.resume(len(load(complete[-1] / "index.npy")))
+                    else:
+                        routed[split_name] = writer
+                if len(routed) > 0:
+                    for item in Xy():
+                        split_name = item[0][0]["split"]
+                        if split_name in routed:
+                            routed[split_name].append(item)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
     def loader(
         self,
         split: str = None,
         batch_size: int = None,
         shuffle: bool = False,
-        random_seed: Union[int, None] = None,
+        random_seed: Union[int, None] = 0,
+        prefetch: int = 0,
+        shuffle_buffer: int = 0,
+        max_tokens: Union[int, None] = None,
+        bucket_size: Union[int, None] = None,
+        batch_workers: int = 0,
         **kwargs,
     ) -> Any:
         """Returns a dataloader of the appropriate framework.
-        Takes care of batching, efficient file loading, and application of the stochastic transforms.
+        Takes care of batching, efficient file loading, collation (see ``Representation.collate``), and application of the stochastic transforms.
+        The framework receives a ``ShardLoader``, a generator function ``loader(partition=0, num_partitions=1, epoch=None, skip=None, worker=0, num_workers=1)`` that iterates one of ``num_partitions`` equally sized parts of the split (e.g. for distributed ranks), and within it the items of one of ``num_workers`` workers (e.g. data loader workers). Partitions are padded to equal size, but the workers of a partition iterate every item of it exactly once. The shuffled order of an epoch only depends on ``random_seed`` and ``epoch``, and its ``state_dict`` can be used to resume mid-epoch.
 
         Parameters
         ----------
@@ -81,54 +266,38 @@ class Task:
         shuffle : bool, optional
             Whether to shuffle the data, by default False
         random_seed : Union[int, None], optional
-            The random seed for shuffling, by default None
+            The random seed for shuffling and the stochastic transforms, by default 0. A fixed seed lets all distributed ranks agree on the shuffled order; None draws a seed per loader (see ``ShardLoader``).
+        prefetch : int, optional
+            The number of shards to read ahead in a background thread, by default 0 (shards are memory mapped and read on demand)
+        shuffle_buffer : int, optional
+            The number of items (not bytes or tokens) to mix across shards when shuffling, which bounds the memory of the shuffle, by default 0 (only the shard order and the items within a batch are shuffled)
+        max_tokens : Union[int, None], optional
+            The token budget of a batch (number of items times their maximum number of residues), by default None. Groups items of similar length into batches that fill the budget, such that little compute is lost to padding.
+        bucket_size : Union[int, None], optional
+            The number of consecutive items sorted by length to form batches with ``max_tokens``, by default None (all items)
+        batch_workers : int, optional
+            The number of processes that load batches and apply the stochastic transforms, by default 0 (in the calling process). Batches are passed back in shared memory. The stochastic transforms need to be picklable.
 
         Returns
         -------
         Any
             A framework-specific dataloader.
         """
-        rng = np.random.default_rng(random_seed)
-        path = self.root / split / self.transform.hash() / "shards"
-        shard_index = load(path / "index.npy")
-        if (
-            not batch_size is None
-            and self.shard_size % batch_size != 0
-            and batch_size % self.shard_size != 0
-        ):
-            warn(
-                "batch_size is not a multiple of shard_size. This causes inefficient data loading."
-            )
-
-        def generator():
-            if shuffle:
-                rng.shuffle(shard_index)
-            shards = (load(path / f"{i}.pkl") for i in shard_index)
-            for current_shard in shards:
-                current_X, current_y = current_shard
-                X_batch, y_batch = [], []
-                while len(X_batch) < (batch_size or np.inf):
-                    if batch_size is None:
-                        b = len(current_X)
-                    else:
-                        b = batch_size - len(X_batch)
-                    X_piece, current_X = current_X[:b], current_X[b:]
-                    y_piece, current_y = current_y[:b], current_y[b:]
-                    X_batch = X_batch + list(X_piece)
-                    y_batch = y_batch + list(y_piece)
-                    if len(current_X) == 0:
-                        try:
-                            current_shard = next(shards)
-                            current_X, current_y = current_shard
-                        except StopIteration:
-                            break
-                X_batch, y_batch = np.asarray(X_batch), np.asarray(y_batch)
-                if shuffle:
-                    permutation = rng.permutation(len(X_batch))
-                    X_batch, y_batch = X_batch[permutation], y_batch[permutation]
-                yield self.transform.stochastic_transform((X_batch, y_batch))
-
-        return self.transform.create_loader(generator, **kwargs)
+        self.cache.touch(self.cache_path)
+        loader = ShardLoader(
+            self.cache_path / split / "shards",
+            batch_size=batch_size,
+            shuffle=shuffle,
+            random_seed=random_seed,
+            prefetch=prefetch,
+            shuffle_buffer=shuffle_buffer,
+            max_tokens=max_tokens,
+            bucket_size=bucket_size,
+            batch_workers=batch_workers,
+            transform=self.transform.batch_transform,
+            stats=self.stats,
+        )
+        return self.transform.create_loader(loader, **kwargs)
 
     def evaluate(self, y_true: ndarray, y_pred: ndarray) -> Dict[str, float]:
         """Computes a set of relevant metrics for the task.
@@ -1,6 +1,12 @@
 from typing import Tuple, Iterator, Any
-from proteinshake.utils import error, ProteinGenerator
-import hashlib, inspect
+import numpy as np
+from proteinshake.utils import (
+    error,
+    fingerprint,
+    init_arguments,
+    measure,
+    ProteinGenerator,
+)
 
 
 class Transform:
@@ -49,21 +55,7 @@ class Transform:
         str
             A hash value.
         """
-        h = hashlib.sha256()
-        h.update(str(self.__class__).encode())
-        h.update(b"|")
-
-        # Get argument names and values using inspect
-        arg_spec = inspect.getargspec(self.__init__)
-        args = arg_spec.args[1:]  # Skip "self"
-
-        # Create a sorted list of key-value pairs for arguments
-        arg_vals = [(arg, getattr(self, arg)) for arg in args]
-        sorted_args = sorted(arg_vals)
-
-        # Update hash with string representation of arguments
-        h.update(repr(sorted_args).encode())
-        return h.hexdigest()
+        return fingerprint([str(self.__class__), init_arguments(self)])
 
 
 class DataTransform(Transform):
@@ -114,6 +106,22 @@ class LabelTransform(Transform):
         return y
 
 
+class StochasticTransform(Transform):
+    """Reshapes the Xy-iterator to additionally take a seed for every sample. A stochastic transform that draws its random numbers from these seeds (e.g. with ``numpy.random.default_rng``) is reproducible, independently of batching and loader workers."""
+
+    stochastic = True
+
+    def __call__(self, Xy, seeds=None):
+        if seeds is None:
+            seeds = np.random.default_rng().integers(
+                2**64, size=len(Xy[1]), dtype=np.uint64
+            )
+        return self.transform(Xy, seeds)
+
+    def transform(self, Xy, seeds):
+        return Xy
+
+
 class IdentityTransform(Transform):
     """Does nothing."""
 
@@ -146,26 +154,63 @@ class Compose:
                     error("You cannot use more than one framework.")
                 setattr(self, "create_loader", transform.create_loader)
 
-    def hash(self):
-        h = hashlib.sha256()
-        for transform in self.deterministic_transforms:
-            h.update(transform.hash().encode())
-        return h.hexdigest()
+    def hash(self, stage=None):
+        """Computes a hash value of the configuration of the deterministic transforms, or of the first ``stage`` of them."""
+        return fingerprint([t.hash() for t in self.deterministic_transforms[:stage]])
+
+    def state_hash(self, stage=None):
+        """Computes a hash value of the fitted state, or of the fitted state of the first ``stage`` transforms."""
+        return fingerprint(self.state_dict()[:stage])
+
+    @staticmethod
+    def _fittable(transform):
+        return type(transform).fit is not Transform.fit
 
     def fit(self, dataset):
+        # only iterate the dataset for transforms that implement fitting
         for transform in self.transforms:
-            transform.fit(dataset)
-
-    def deterministic_transform(self, Xy):
-        for transform in self.deterministic_transforms:
-            Xy = transform(Xy)
+            if self._fittable(transform):
+                transform.fit(dataset)
+
+    def state_dict(self):
+        """Returns the fitted state, i.e. the attributes of all transforms that implement ``fit``."""
+        return [
+            dict(vars(transform)) if self._fittable(transform) else {}
+            for transform in self.transforms
+        ]
+
+    def load_state_dict(self, state):
+        """Restores the fitted state returned by ``state_dict``."""
+        for transform, transform_state in zip(self.transforms, state):
+            vars(transform).update(transform_state)
+
+    def deterministic_transform(self, Xy, start=0, stop=None):
+        for transform in self.deterministic_transforms[start:stop]:
+            with measure(f"deterministic/{type(transform).__name__}", len(Xy[1])):
+                Xy = transform(Xy)
         return Xy
 
-    def stochastic_transform(self, Xy):
+    def stochastic_transform(self, Xy, seeds=None):
         for transform in self.stochastic_transforms:
-            Xy = transform(Xy)
+            with measure(f"stochastic/{type(transform).__name__}", len(Xy[1])):
+                if isinstance(transform, StochasticTransform):
+                    Xy = transform(Xy, seeds)
+                else:
+                    Xy = transform(Xy)
         return Xy
 
+    def collate(self, Xy):
+        """Collates a loaded batch with the transforms that implement ``collate`` (e.g. representations)."""
+        with measure("collate", len(Xy[1])):
+            for transform in self.transforms:
+                if hasattr(transform, "collate"):
+                    Xy = transform.collate(Xy)
+        return Xy
+
+    def batch_transform(self, Xy, seeds=None):
+        """Collates a loaded batch and applies the stochastic transforms, using the seeds of its samples."""
+        return self.stochastic_transform(self.collate(Xy), seeds)
+
     def inverse_transform(self, y):
         for transform in self.transforms:
             if hasattr(transform, "inverse_transform"):
@@ -1 +1,5 @@
 from .min_max_scaler import MinMaxScalerTransform
+from .random_rotation import RandomRotationTransform
+from .gaussian_noise import GaussianNoiseTransform
+from .random_crop import RandomCropTransform
+from .residue_mask import ResidueMaskTransform
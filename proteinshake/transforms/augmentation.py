@@ -0,0 +1,123 @@
+import numpy as np
+from ..transform import StochasticTransform
+from ..utils import splitmix64
+
+
+def unpack(X):
+    """Converts a batch of coordinates to packed values and offsets.
+    Accepts the formats of the point representation: a dense array of shape ``(..., length, 3)``, an object array of coordinate arrays, a padded tuple of coordinates and mask, or a packed tuple of values and offsets.
+
+    Returns
+    -------
+    tuple
+        The packed values, the offsets, and a function that converts packed values and offsets back to the format of ``X``.
+    """
+    if isinstance(X, tuple) and X[1].dtype == bool:
+        coords, mask = X
+        shape = mask.shape[:-1]
+        mask = mask.reshape(-1, mask.shape[-1])
+        lengths = mask.sum(axis=1)
+        values = coords.reshape(len(mask), mask.shape[1], -1)[mask]
+
+        def restore(values, offsets):
+            lengths = np.diff(offsets)
+            protein, residue = _positions(offsets)
+            longest = int(lengths.max(initial=0))
+            coords = np.zeros((len(lengths), longest, values.shape[1]), values.dtype)
+            mask = np.zeros((len(lengths), longest), dtype=bool)
+            coords[protein, residue] = values
+            mask[protein, residue] = True
+            return (
+                coords.reshape(*shape, longest, values.shape[1]),
+                mask.reshape(*shape, longest),
+            )
+
+    elif isinstance(X, tuple):
+        values, offsets = X
+        return values, np.asarray(offsets, dtype=np.int64), lambda *packed: packed
+    elif X.dtype == object:
+        items = X.ravel()
+        lengths = np.asarray([len(item) for item in items], dtype=np.int64)
+        values = (
+            np.concatenate(items)
+            if len(items) > 0
+            else np.empty((0, 3), dtype=np.float32)
+        )
+
+        def restore(values, offsets):
+            return _split(values, offsets, X.shape)
+
+    else:
+        shape = X.shape[:-2]
+        lengths = np.full(int(np.prod(shape)), X.shape[-2], dtype=np.int64)
+        values = X.reshape(-1, X.shape[-1])
+
+        def restore(values, offsets):
+            lengths = np.diff(offsets)
+            if len(set(lengths.tolist())) > 1:
+                return _split(values, offsets, shape)
+            length = int(lengths[0]) if len(lengths) > 0 else X.shape[-2]
+            return values.reshape(*shape, length, values.shape[1])
+
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    return values, offsets, restore
+
+
+def _split(values, offsets, shape):
+    """Splits packed values into an object array of coordinate arrays."""
+    result = np.empty(len(offsets) - 1, dtype=object)
+    for i, (low, high) in enumerate(zip(offsets[:-1], offsets[1:])):
+        result[i] = values[low:high]
+    return result.reshape(shape)
+
+
+def _positions(offsets):
+    """The protein and the position within the protein of every packed residue."""
+    lengths = np.diff(offsets)
+    protein = np.repeat(np.arange(len(lengths)), lengths)
+    return protein, np.arange(offsets[-1]) - offsets[:-1][protein]
+
+
+class CoordinateAugmentation(StochasticTransform):
+    """Base class of the vectorised coordinate augmentations. Works on all batch formats of the ``PointRepresentationTransform``.
+    Every protein draws from its own random stream, derived from the seed of its sample and its position in the sample, such that the augmentation of a protein does not depend on the batch it is in.
+    Subclasses implement ``augment`` on packed coordinates.
+    """
+
+    #: distinguishes the random streams of the different augmentations
+    stream = 0
+
+    def transform(self, Xy, seeds):
+        X, y = Xy
+        values, offsets, restore = unpack(X)
+        values, offsets = self.augment(
+            values, offsets, self.protein_seeds(offsets, seeds)
+        )
+        return restore(values, offsets), y
+
+    def protein_seeds(self, offsets, seeds):
+        """Derives the seed of the random stream of every protein from the seeds of the samples."""
+        seeds = np.asarray(seeds, dtype=np.uint64)
+        proteins = len(offsets) - 1
+        inputs = proteins // max(len(seeds), 1)
+        streams = splitmix64(np.arange(inputs) + (self.stream << 32))
+        return splitmix64(np.repeat(seeds, inputs) ^ np.tile(streams, len(seeds)))
+
+    def augment(self, values, offsets, seeds):
+        """Augments packed coordinates.
+
+        Parameters
+        ----------
+        values:
+            The concatenated coordinates of the proteins, of shape ``(residues, 3)``.
+        offsets:
+            The offsets of the proteins in ``values``.
+        seeds:
+            The seed of the random stream of every protein.
+
+        Returns
+        -------
+        tuple
+            The augmented values and offsets.
+        """
+        return values, offsets
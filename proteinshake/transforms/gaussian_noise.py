@@ -0,0 +1,25 @@
+import numpy as np
+from .augmentation import CoordinateAugmentation, _positions
+from ..utils import stream_normal
+
+
+class GaussianNoiseTransform(CoordinateAugmentation):
+    """Adds independent Gaussian noise to every coordinate.
+
+    Parameters
+    ----------
+    std:
+        The standard deviation of the noise, by default 1.0
+    """
+
+    stream = 2
+
+    def __init__(self, std=1.0):
+        self.std = std
+
+    def augment(self, values, offsets, seeds):
+        protein, residue = _positions(offsets)
+        dims = np.arange(values.shape[1])
+        counters = residue[:, None] * values.shape[1] + dims
+        noise = stream_normal(seeds[protein][:, None], counters)
+        return (values + self.std * noise).astype(values.dtype), offsets
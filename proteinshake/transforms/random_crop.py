@@ -0,0 +1,29 @@
+import numpy as np
+from .augmentation import CoordinateAugmentation, _positions
+from ..utils import stream_uniform
+
+
+class RandomCropTransform(CoordinateAugmentation):
+    """Crops every protein to a random contiguous segment. Proteins that are shorter than the segment are kept as they are.
+    Only the coordinates are cropped, residue-level targets are not.
+
+    Parameters
+    ----------
+    size:
+        The number of residues of the segment, by default 128
+    """
+
+    stream = 3
+
+    def __init__(self, size=128):
+        self.size = size
+
+    def augment(self, values, offsets, seeds):
+        lengths = np.diff(offsets)
+        sizes = np.minimum(lengths, self.size)
+        starts = np.floor(stream_uniform(seeds, 0) * (lengths - sizes + 1))
+        starts = starts.astype(np.int64)
+        protein, residue = _positions(offsets)
+        keep = (residue >= starts[protein]) & (residue < (starts + sizes)[protein])
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        return values[keep], offsets
@@ -0,0 +1,42 @@
+import numpy as np
+from .augmentation import CoordinateAugmentation, _positions
+from ..utils import stream_uniform
+
+
+class RandomRotationTransform(CoordinateAugmentation):
+    """Rotates every protein by a uniformly random rotation in SO(3).
+
+    Parameters
+    ----------
+    center:
+        Whether to rotate around the centroid of the protein instead of the origin, by default True
+    """
+
+    stream = 1
+
+    def __init__(self, center=True):
+        self.center = center
+
+    def augment(self, values, offsets, seeds):
+        # uniform unit quaternions (Shoemake), one per protein
+        u = stream_uniform(seeds[:, None], np.arange(3))
+        a, b = np.sqrt(1 - u[:, 0]), np.sqrt(u[:, 0])
+        x, y = a * np.sin(2 * np.pi * u[:, 1]), a * np.cos(2 * np.pi * u[:, 1])
+        z, w = b * np.sin(2 * np.pi * u[:, 2]), b * np.cos(2 * np.pi * u[:, 2])
+        rotations = np.stack(
+            [
+                [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+                [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+                [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+            ]
+        ).transpose(2, 0, 1)
+        protein, _ = _positions(offsets)
+        coords = values.astype(np.float64)
+        centroids = np.zeros((len(seeds), values.shape[1]))
+        if self.center:
+            sums = np.concatenate([np.zeros((1, values.shape[1])), coords.cumsum(0)])
+            lengths = np.maximum(np.diff(offsets), 1)[:, None]
+            centroids = (sums[offsets[1:]] - sums[offsets[:-1]]) / lengths
+        coords = coords - centroids[protein]
+        coords = np.einsum("nij,nj->ni", rotations[protein], coords)
+        return (coords + centroids[protein]).astype(values.dtype), offsets
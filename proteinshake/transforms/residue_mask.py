@@ -0,0 +1,67 @@
+import numpy as np
+from .augmentation import CoordinateAugmentation, unpack, _positions, _split
+from ..utils import stream_uniform
+
+
+class ResidueMaskTransform(CoordinateAugmentation):
+    """Masks random residues by replacing their coordinates with a fixed value.
+    Since the value may also be a real coordinate, the batch is returned as ``(X, masked)``, where ``masked`` is a boolean array of the masked residues in the layout of ``X``: of shape ``(..., length)`` for dense arrays and padded tuples, of shape ``(residues,)`` for packed tuples, and an object array of boolean arrays for object arrays. The mask should therefore be the last coordinate augmentation.
+
+    Parameters
+    ----------
+    probability:
+        The probability of a residue to be masked, by default 0.15
+    value:
+        The value of the masked coordinates, by default 0.0
+    """
+
+    stream = 4
+
+    def __init__(self, probability=0.15, value=0.0):
+        self.probability = probability
+        self.value = value
+
+    def transform(self, Xy, seeds):
+        X, y = Xy
+        values, offsets, restore = unpack(X)
+        masked = self.mask(offsets, self.protein_seeds(offsets, seeds))
+        values = values.copy()
+        values[masked] = self.value
+        X = restore(values, offsets)
+        if isinstance(X, tuple) and X[1].dtype == bool:
+            padded = np.zeros(X[1].shape, dtype=bool)
+            protein, residue = _positions(offsets)
+            padded.reshape(len(offsets) - 1, padded.shape[-1])[
+                protein, residue
+            ] = masked
+            masked = padded
+        elif isinstance(X, tuple):
+            pass
+        elif X.dtype == object:
+            masked = _split(masked, offsets, X.shape)
+        else:
+            masked = masked.reshape(X.shape[:-1])
+        return (X, masked), y
+
+    def mask(self, offsets, seeds):
+        """Draws the masked residues.
+
+        Parameters
+        ----------
+        offsets:
+            The offsets of the proteins in the packed coordinates.
+        seeds:
+            The seed of the random stream of every protein.
+
+        Returns
+        -------
+        ndarray
+            Whether each packed residue is masked.
+        """
+        protein, residue = _positions(offsets)
+        return stream_uniform(seeds[protein], residue) < self.probability
+
+    def augment(self, values, offsets, seeds):
+        values = values.copy()
+        values[self.mask(offsets, seeds)] = self.value
+        return values, offsets
@@ -1,2 +1,11 @@
 from .constants import *
 from .io import *
+from .columnar import *
+from .parallel import *
+from .predicate import *
+from .stats import *
+from .shards import *
+from .hashing import *
+from .cache import *
+from .loader import *
+from .rng import *
@@ -0,0 +1,96 @@
+import os, re, shutil, time
+from pathlib import Path
+from .io import LOCATIONS, info
+
+
+def directory_size(path):
+    """The total size of the files in a directory tree, in bytes."""
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path)
+        for name in names
+    )
+
+
+_key = re.compile(r"[0-9a-f]{64}")
+
+
+class CacheManager:
+    """Keeps the transform caches of all tasks within a disk budget.
+    A cache entry is a directory ``<root>/<task>/<key>`` holding the shards of one transform stage. Entries are marked as used with ``touch``, and ``evict`` deletes the least recently used entries until the total size fits into the budget.
+    Only directories named by a cache key (a sha256 digest) and marked by ``touch`` are entries, such that other directories under the root are never deleted.
+    """
+
+    def __init__(self, root=LOCATIONS.tasks, budget=None):
+        """
+
+        Parameters
+        ----------
+        root:
+            The directory containing the task directories, by default ``LOCATIONS.tasks``
+        budget:
+            The maximum total size of the caches in bytes, by default None (unlimited)
+        """
+        self.root = Path(root)
+        self.budget = budget
+
+    def touch(self, path):
+        """Marks a cache entry as used now."""
+        path = Path(path)
+        os.makedirs(path, exist_ok=True)
+        with open(path / ".last_used", "w") as file:
+            file.write(str(time.time()))
+
+    def last_used(self, path):
+        """The time a cache entry was last used, falling back to its modification time."""
+        try:
+            with open(Path(path) / ".last_used", "r") as file:
+                return float(file.read())
+        except (OSError, ValueError):
+            return os.path.getmtime(path)
+
+    def entries(self):
+        """Lists all cache entries, least recently used first."""
+        if not os.path.exists(self.root):
+            return []
+        entries = [
+            entry
+            for task in self.root.iterdir()
+            if task.is_dir()
+            for entry in task.iterdir()
+            if entry.is_dir()
+            and _key.fullmatch(entry.name)
+            and os.path.exists(entry / ".last_used")
+        ]
+        return sorted(entries, key=self.last_used)
+
+    def evict(self, keep=()):
+        """Deletes the least recently used cache entries until the caches fit into the budget.
+
+        Parameters
+        ----------
+        keep:
+            Entries that must not be deleted, e.g. the ones in use.
+
+        Returns
+        -------
+        list
+            The deleted entries.
+        """
+        if self.budget is None:
+            return []
+        keep = {Path(path).resolve() for path in keep}
+        entries = [(entry, directory_size(entry)) for entry in self.entries()]
+        total = sum(size for _, size in entries)
+        evicted = []
+        for entry, size in entries:
+            if total <= self.budget:
+                break
+            if entry.resolve() in keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted.append(entry)
+        if evicted:
+            info(f"Evicted {len(evicted)} transform caches to stay within the budget.")
+        return evicted
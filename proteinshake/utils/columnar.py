@@ -0,0 +1,182 @@
+from pathlib import Path
+import json, os, shutil
+import numpy as np
+
+COLUMNAR_DTYPES = {"int": np.int32, "float": np.float32, "bool": np.bool_}
+
+
+def _column_kind(value):
+    """Determines how a protein field is laid out in the columnar store.
+
+    Parameters
+    ----------
+    value:
+        A value of a protein dictionary.
+
+    Returns
+    -------
+    Tuple[str, str, List[int]]
+        The column kind ('string', 'array' or 'scalar'), the dtype name, and the trailing shape of array items.
+    """
+    if isinstance(value, str):
+        return "string", "uint8", []
+    if isinstance(value, (bool, np.bool_)):
+        return "scalar", "bool", []
+    if isinstance(value, (int, np.integer)):
+        return "scalar", "int", []
+    if isinstance(value, (float, np.floating)):
+        return "scalar", "float", []
+    if isinstance(value, (list, tuple, np.ndarray)):
+        array = np.asarray(value)
+        if array.dtype.kind not in "biuf" or array.ndim == 0:
+            raise ValueError(f"Unsupported array type: {array.dtype}")
+        kind = {"b": "bool", "i": "int", "u": "int", "f": "float"}[array.dtype.kind]
+        return "array", kind, list(array.shape[1:])
+    raise ValueError(f"Unsupported data type: {type(value)}")
+
+
+class ColumnarWriter:
+    """Streams protein dictionaries into a columnar, memory-mappable layout.
+    Every field is stored as one contiguous binary buffer. Strings and arrays additionally get an offsets index with one entry per protein (plus one), such that the i-th protein occupies ``buffer[offsets[i]:offsets[i+1]]``.
+    Numeric types follow the avro schema, i.e. int32, float32 and bool.
+    """
+
+    def __init__(self, path):
+        """
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The directory to write the columns to.
+        """
+        self.path = Path(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.columns = None
+        self.files = {}
+        self.offsets = {}
+        self.num_proteins = 0
+
+    def _open(self, protein):
+        self.columns = {}
+        for name, value in protein.items():
+            kind, dtype, shape = _column_kind(value)
+            self.columns[name] = {"kind": kind, "dtype": dtype, "shape": shape}
+            self.files[name] = open(self.path / f"{name}.bin", "wb")
+            if kind != "scalar":
+                self.offsets[name] = [0]
+
+    def write(self, protein):
+        """Appends a protein to the store.
+
+        Parameters
+        ----------
+        protein : Dict
+            A protein dictionary. Must have the same fields and types as the first written protein.
+        """
+        if self.columns is None:
+            self._open(protein)
+        if protein.keys() != self.columns.keys():
+            raise ValueError("All proteins must have the same fields.")
+        for name, column in self.columns.items():
+            value = protein[name]
+            if column["kind"] == "string":
+                data = value.encode()
+                self.offsets[name].append(self.offsets[name][-1] + len(data))
+            else:
+                dtype = COLUMNAR_DTYPES[column["dtype"]]
+                array = np.asarray(value, dtype=dtype)
+                if column["kind"] == "array":
+                    if len(array) > 0 and list(array.shape[1:]) != column["shape"]:
+                        raise ValueError(f"Inconsistent array shape in field {name}.")
+                    self.offsets[name].append(self.offsets[name][-1] + len(array))
+                data = array.tobytes()
+            self.files[name].write(data)
+        self.num_proteins += 1
+
+    def close(self):
+        """Writes the offsets and metadata. The store is only readable after closing."""
+        for file in self.files.values():
+            file.close()
+        for name, offsets in self.offsets.items():
+            np.asarray(offsets, dtype=np.int64).tofile(
+                self.path / f"{name}.offsets.bin"
+            )
+        with open(self.path / "columns.json", "w") as file:
+            json.dump(
+                {"num_proteins": self.num_proteins, "columns": self.columns or {}}, file
+            )
+
+    def abort(self):
+        """Closes all files and removes the partially written store."""
+        for file in self.files.values():
+            file.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ColumnarReader:
+    """Reads a store written by ``ColumnarWriter``.
+    Columns are memory-mapped, such that array fields are returned as zero-copy numpy views into the page cache.
+    """
+
+    def __init__(self, path, columns=None):
+        """
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The directory of the columnar store.
+        columns : Union[List[str], None], optional
+            The fields to read. Other fields are not mapped into memory. By default None (all fields)
+        """
+        self.path = Path(path)
+        with open(self.path / "columns.json", "r") as file:
+            meta = json.load(file)
+        self.num_proteins = meta["num_proteins"]
+        self.columns = meta["columns"]
+        if columns is not None:
+            missing = set(columns) - set(self.columns)
+            if missing:
+                raise KeyError(f"Fields {sorted(missing)} do not exist.")
+            self.columns = {name: self.columns[name] for name in columns}
+        self.data, self.offsets = {}, {}
+        for name, column in self.columns.items():
+            dtype = (
+                np.uint8
+                if column["kind"] == "string"
+                else COLUMNAR_DTYPES[column["dtype"]]
+            )
+            self.data[name] = self._memmap(f"{name}.bin", dtype, column["shape"])
+            if column["kind"] != "scalar":
+                self.offsets[name] = self._memmap(f"{name}.offsets.bin", np.int64, [])
+
+    def _memmap(self, filename, dtype, shape):
+        path = self.path / filename
+        if os.path.getsize(path) == 0:  # numpy cannot map empty files
+            return np.zeros((0, *shape), dtype=dtype)
+        array = np.memmap(path, dtype=dtype, mode="r")
+        return array.reshape(-1, *shape).view(np.ndarray)
+
+    @staticmethod
+    def exists(path):
+        """Checks whether a completely written columnar store exists at path."""
+        return os.path.exists(Path(path) / "columns.json")
+
+    def __len__(self):
+        return self.num_proteins
+
+    def field(self, name, i):
+        """Returns the value of field ``name`` of the i-th protein."""
+        column = self.columns[name]
+        if column["kind"] == "scalar":
+            return self.data[name][i].item()
+        start, stop = self.offsets[name][i], self.offsets[name][i + 1]
+        if column["kind"] == "string":
+            return self.data[name][start:stop].tobytes().decode()
+        return self.data[name][start:stop]
+
+    def __getitem__(self, i):
+        return {name: self.field(name, i) for name in self.columns}
+
+    def __iter__(self):
+        for i in range(self.num_proteins):
+            yield self[i]
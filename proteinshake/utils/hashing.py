@@ -0,0 +1,73 @@
+import hashlib, inspect
+import numpy as np
+
+
+def _update(h, obj):
+    if isinstance(obj, dict):
+        h.update(b"{")
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for value in obj:
+            _update(h, value)
+        h.update(b"]")
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            _update(h, obj.tolist())
+        else:
+            h.update(f"ndarray:{obj.dtype.str}:{obj.shape}:".encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, np.generic):
+        _update(h, obj.item())
+    elif obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        h.update(f"{type(obj).__name__}:{obj!r}|".encode())
+    elif callable(getattr(obj, "hash", None)):
+        h.update(obj.hash().encode())
+    else:
+        h.update(f"{type(obj).__module__}.{type(obj).__qualname__}".encode())
+        _update(h, vars(obj) if hasattr(obj, "__dict__") else repr(obj))
+
+
+def fingerprint(obj):
+    """Computes a sha256 digest of a nested object that is stable across processes and machines.
+    Supports dictionaries, lists, tuples, numpy arrays and python scalars. Objects with a ``hash`` method (e.g. transforms) are represented by its result, other objects by their class and attributes.
+
+    Parameters
+    ----------
+    obj:
+        The object to digest.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    h = hashlib.sha256()
+    _update(h, obj)
+    return h.hexdigest()
+
+
+def init_arguments(obj):
+    """Returns the instantiation arguments of an object, assuming they are stored as attributes of the same name.
+
+    Parameters
+    ----------
+    obj:
+        The object.
+
+    Returns
+    -------
+    dict
+        A dictionary of argument names and values.
+    """
+    parameters = list(inspect.signature(type(obj).__init__).parameters.values())[1:]
+    return {
+        parameter.name: getattr(obj, parameter.name)
+        for parameter in parameters
+        if parameter.kind
+        not in [inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD]
+        and hasattr(obj, parameter.name)
+    }
@@ -1,11 +1,11 @@
-from itertools import islice
-import gzip, json, pickle, os
+import gzip, json, pickle, os, io
 from pathlib import Path
 import numpy as np
 import time
 import locale
 from types import SimpleNamespace
 from rich.console import Console
+from fastavro import reader as avro_reader
 
 console = Console()
 
@@ -38,7 +38,7 @@ def dict_to_avro_schema(data):
     Parameters
     ----------
     example: dict
-        A protein dictionary.
+        A protein dictionary. Values can be python types or numpy arrays and scalars.
 
     Returns
     -------
@@ -46,6 +46,7 @@ def dict_to_avro_schema(data):
         An avro schema.
     """
     typedict = {"int": "int", "float": "float", "str": "string", "bool": "boolean"}
+    kinds = {"b": "boolean", "i": "int", "u": "int", "f": "float"}
 
     if isinstance(data, dict):
         fields = []
@@ -57,17 +58,84 @@ def dict_to_avro_schema(data):
             return {"type": "array", "items": dict_to_avro_schema(data[0])}
         else:
             return {"type": "null"}
+    elif isinstance(data, np.ndarray) and data.dtype.kind in kinds:
+        schema = {"type": kinds[data.dtype.kind]}
+        for _ in range(data.ndim):
+            schema = {"type": "array", "items": schema}
+        return schema
+    elif isinstance(data, np.generic) and data.dtype.kind in kinds:
+        return {"type": kinds[data.dtype.kind]}
     elif type(data).__name__ in typedict:
         return {"type": typedict[type(data).__name__]}
     else:
         raise ValueError(f"Unsupported data type: {type(data)}")
 
 
+def to_avro_record(protein):
+    """Converts the numpy arrays and scalars of a protein dictionary to python types, which avro encodes much faster."""
+    return {
+        key: value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+        for key, value in protein.items()
+    }
+
+
+def read_avro_block(path, header_size, offset, size, reader_schema=None):
+    """Decodes a single block of an avro file without reading the blocks before it.
+
+    Parameters
+    ----------
+    path:
+        The path of the avro file.
+    header_size:
+        The size of the avro header in bytes.
+    offset:
+        The byte offset of the block.
+    size:
+        The size of the block in bytes, including the trailing sync marker.
+    reader_schema:
+        An optional reader schema, e.g. to decode only a subset of the fields.
+
+    Returns
+    -------
+    list
+        The records of the block.
+    """
+    with open(path, "rb") as file:
+        header = file.read(header_size)
+        file.seek(offset)
+        block = file.read(size)
+    return list(avro_reader(io.BytesIO(header + block), reader_schema))
+
+
+def project_avro_schema(schema, columns):
+    """Restricts a record schema to a subset of its fields.
+
+    Parameters
+    ----------
+    schema:
+        An avro record schema.
+    columns:
+        The field names to keep.
+
+    Returns
+    -------
+    schema
+        The projected avro schema.
+    """
+    fields = {field["name"]: field for field in schema["fields"]}
+    missing = set(columns) - set(fields)
+    if missing:
+        raise KeyError(f"Fields {sorted(missing)} do not exist.")
+    return {**schema, "fields": [fields[name] for name in columns]}
+
+
 class ProteinGenerator(object):
-    def __init__(self, generator, length, assets={}):
+    def __init__(self, generator, length, assets={}, manifest=None):
         self.generator = generator
         self.length = length
         self.assets = assets
+        # maps source files to the positions of their proteins, filled during iteration (see LocalAdapter)
+        self.manifest = manifest
 
     def __len__(self):
         return self.length
@@ -157,19 +225,6 @@ def load(path):
     return obj
 
 
-def sharded(iterator, shard_size):
-    while shard := list(islice(iterator, shard_size)):
-        X, y = list(zip(*shard))
-        yield np.asarray(X, dtype=object), np.asarray(y, dtype=object)
-
-
-def save_shards(iterator, path):
-    path = Path(path)
-    for i, shard in enumerate(iterator):
-        save(shard, path / f"{i}.pkl")
-    save(np.arange(i + 1), path / "index.npy")
-
-
 def error(msg):
     console.print_exception(msg)
 
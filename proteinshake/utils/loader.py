@@ -0,0 +1,497 @@
+from pathlib import Path
+from contextlib import nullcontext
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from .io import load
+from .parallel import prefetched
+from .rng import sample_seeds
+from .stats import Stats, measure
+from .shards import load_shard, partition_shards, densify, _align
+
+
+def shuffle_buffer_order(n, buffer_size, rng):
+    """Simulates a shuffle buffer on the positions ``0..n-1`` of a stream.
+    The buffer is filled with the first ``buffer_size`` positions. Every refill adds the next ``buffer_size`` positions, and emits as many random positions of the buffer, drawn with one permutation. The remaining buffer is emitted in random order at the end.
+
+    Parameters
+    ----------
+    n:
+        The length of the stream.
+    buffer_size:
+        The number of buffered positions, i.e. items, not bytes or tokens.
+    rng:
+        A numpy random generator.
+
+    Returns
+    -------
+    ndarray
+        The emitted positions.
+    """
+    buffer_size = max(min(buffer_size, n), 1)
+    buffer, emitted = np.arange(buffer_size), []
+    for start in range(buffer_size, n, buffer_size):
+        pool = np.concatenate([buffer, np.arange(start, min(start + buffer_size, n))])
+        pool = pool[rng.permutation(len(pool))]
+        emitted.append(pool[: len(pool) - buffer_size])
+        buffer = pool[len(pool) - buffer_size :]
+    emitted.append(buffer[rng.permutation(len(buffer))])
+    return np.concatenate(emitted)[:n]
+
+
+def token_batches(lengths, max_tokens, batch_size=None):
+    """Splits a sequence of items into consecutive batches whose padded size (number of items times the maximum length) does not exceed a token budget.
+    Items that exceed the budget on their own form a batch of one.
+
+    Parameters
+    ----------
+    lengths:
+        The lengths of the items, usually sorted.
+    max_tokens:
+        The token budget of a batch.
+    batch_size:
+        The maximum number of items of a batch, by default None (unlimited)
+
+    Returns
+    -------
+    list
+        The batch boundaries, starting with 0 and ending with the number of items.
+    """
+    bounds, start, longest = [0], 0, 0
+    for k, length in enumerate(lengths):
+        longest = max(longest, length)
+        count = k - start + 1
+        if count > 1 and (
+            count * longest > max_tokens or (batch_size and count > batch_size)
+        ):
+            bounds.append(k)
+            start, longest = k, length
+    bounds.append(len(lengths))
+    return bounds
+
+
+def to_shared(obj):
+    """Copies the numeric arrays of a nested tuple into a shared memory block, such that it can be passed to another process without pickling the arrays.
+
+    Parameters
+    ----------
+    obj:
+        A nested tuple of arrays (e.g. a batch). Other objects are kept in the returned structure.
+
+    Returns
+    -------
+    tuple
+        The structure of the object, and the name of the shared memory block (None if there are no numeric arrays). Pass both to ``from_shared``.
+    """
+    arrays = []
+
+    def structure(x):
+        if isinstance(x, tuple):
+            return ("tuple", [structure(value) for value in x])
+        if isinstance(x, np.ndarray) and x.dtype != object:
+            arrays.append(x)
+            return ("array", x.dtype.str, x.shape)
+        return ("object", x)
+
+    tree = structure(obj)
+    size = sum(_align(array.nbytes) for array in arrays)
+    if size == 0:
+        return tree, None
+    memory = SharedMemory(create=True, size=size)
+    # the receiving process unlinks the block
+    resource_tracker.unregister(memory._name, "shared_memory")
+    offset = 0
+    for array in arrays:
+        np.ndarray(array.shape, array.dtype, memory.buf, offset)[...] = array
+        offset += _align(array.nbytes)
+    memory.close()
+    return tree, memory.name
+
+
+def from_shared(tree, name):
+    """Restores an object passed with ``to_shared``, and releases the shared memory block."""
+    memory = SharedMemory(name) if name is not None else None
+    offset = 0
+
+    def restore(node):
+        nonlocal offset
+        if node[0] == "tuple":
+            return tuple(restore(value) for value in node[1])
+        if node[0] == "object":
+            return node[1]
+        dtype, shape = np.dtype(node[1]), tuple(node[2])
+        array = np.ndarray(shape, dtype, memory.buf, offset).copy()
+        offset += _align(array.nbytes)
+        return array
+
+    try:
+        return restore(tree)
+    finally:
+        if memory is not None:
+            memory.close()
+            memory.unlink()
+
+
+_worker = {}
+
+
+def _init_worker(path, transform, profile=False):
+    _worker.update(
+        path=path, transform=transform, shards=OrderedDict(), profile=profile
+    )
+
+
+def _process_batch(batch, position, seeds):
+    stats = Stats() if _worker["profile"] else None
+    with stats or nullcontext():
+        shards = _worker["shards"]
+        ids = np.unique(batch[:, 0]).tolist()
+        for i in ids:
+            if i not in shards:
+                shards[i] = _load(_worker["path"] / str(i))
+            shards.move_to_end(i)
+        output = _assemble(shards, batch, position)
+        # keep the mappings of recently used shards
+        while len(shards) > max(8, len(ids)):
+            shards.popitem(last=False)
+        if _worker["transform"] is not None:
+            output = _worker["transform"](output, seeds)
+    return (*to_shared(output), stats and stats.state_dict())
+
+
+def _load(path, mmap=True, stats=None):
+    with measure("shard read", stats=stats) as counts:
+        shard = load_shard(path, mmap=mmap)
+        counts["items"] = len(shard[-1])
+    return shard
+
+
+def _assemble(shards, plan, position):
+    with measure("batch assembly", len(plan)) as counts:
+        batch = _gather(shards, plan, position)
+        counts["bytes"] = sum(part.nbytes for part in batch if part.dtype != object)
+    return batch
+
+
+def _items(arrays):
+    # splits arrays whose item shapes differ between shards (e.g. dense shards of different lengths, or dense and ragged shards) into object arrays of their items
+    first = arrays[0].shape
+    objects = [array.ndim for array in arrays if array.dtype == object]
+    ndim = (
+        min(objects)
+        if objects
+        else next(
+            axis
+            for axis in range(1, len(first) + 1)
+            if any(
+                array.shape[axis : axis + 1] != first[axis : axis + 1]
+                for array in arrays
+            )
+        )
+    )
+    split = []
+    for array in arrays:
+        if array.dtype != object or array.ndim != ndim:
+            items = np.empty(array.shape[:ndim], dtype=object)
+            for index in np.ndindex(items.shape):
+                items[index] = array[index]
+            array = items
+        split.append(array)
+    return split
+
+
+def _gather(shards, plan, position):
+    # out[position[k]] receives the item plan[k] = (shard, row)
+    ids, inverse = np.unique(plan[:, 0], return_inverse=True)
+    batch = []
+    for part in range(len(shards[ids[0]])):
+        arrays = [shards[i][part] for i in ids]
+        if len({array.shape[1:] for array in arrays}) > 1:
+            arrays = _items(arrays)
+        out = np.empty(
+            (len(plan), *arrays[0].shape[1:]),
+            dtype=np.result_type(*[array.dtype for array in arrays]),
+        )
+        for k, array in enumerate(arrays):
+            items = np.nonzero(inverse == k)[0]
+            rows = plan[items, 1]
+            if rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+                out[position[items]] = array[rows[0] : rows[-1] + 1]
+            else:
+                out[position[items]] = array[rows]
+        batch.append(densify(out))
+    return tuple(batch)
+
+
+class ShardLoader:
+    """Iterates the shards of a split in batches.
+    Every epoch is planned on the level of item indices before any data is loaded: the shard order, the part of the items belonging to a partition (see ``partition_shards``), the shuffle buffer, and the batches. Batches are then gathered from the memory mapped shards, and shards are released after their last use.
+    Since the plan only depends on the random seed and the epoch, iteration can be resumed mid-epoch from ``state_dict`` without loading the skipped batches.
+    """
+
+    def __init__(
+        self,
+        path,
+        batch_size=None,
+        shuffle=False,
+        random_seed=0,
+        prefetch=0,
+        shuffle_buffer=0,
+        max_tokens=None,
+        bucket_size=None,
+        batch_workers=0,
+        transform=None,
+        stats=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        path:
+            The shard directory.
+        batch_size:
+            The batch size, by default None (a single batch of all items)
+        shuffle:
+            Whether to shuffle, by default False. Shuffles the shard order and the items within each batch, or, with a ``shuffle_buffer``, the items across shards.
+        random_seed:
+            The random seed, by default 0. As in ``torch.utils.data.DistributedSampler``, it is fixed by default, such that the loaders of all distributed ranks agree on the shuffled order of an epoch. If None, a seed is drawn when the loader is created, which is only shared by the workers of this loader, not by other ranks.
+        prefetch:
+            The number of shards to read ahead in a background thread, by default 0 (shards are memory mapped and read on demand)
+        shuffle_buffer:
+            The number of items (not bytes or tokens) to mix across shards when shuffling, by default 0 (no buffer)
+        max_tokens:
+            The token budget of a batch, i.e. the number of items times their maximum length, by default None (batches by ``batch_size`` only). Items are then grouped into batches of similar lengths, such that little compute is lost to padding. Partitions may get different numbers of batches.
+        bucket_size:
+            The number of consecutive items that are sorted by length to form batches with ``max_tokens``, by default None (all items of the partition)
+        batch_workers:
+            The number of processes that load the batches and apply ``transform``, by default 0 (in the calling process). Finished batches are passed back in shared memory.
+        transform:
+            A function ``transform(batch, seeds)`` applied to every batch, by default None. The seeds are derived from the random seed, the epoch, and the index of every sample (see ``sample_seeds``), such that the output is reproducible regardless of batching and workers.
+        stats:
+            The ``Stats`` to record the shard reads, the batch assembly and the transforms in, by default None. The report is saved at the end of every epoch if the stats have a path.
+        """
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random_seed = (
+            np.random.SeedSequence().entropy if random_seed is None else random_seed
+        )
+        self.prefetch = prefetch
+        self.shuffle_buffer = shuffle_buffer
+        self.max_tokens = max_tokens
+        self.bucket_size = bucket_size
+        self.batch_workers = batch_workers
+        self.transform = transform
+        self.stats = stats
+        self.sizes = load(self.path / "sizes.npy")
+        self.lengths = load(self.path / "lengths.npy") if max_tokens else None
+        self.epoch, self.batches = 0, 0
+
+    def plan(self, partition=0, num_partitions=1, epoch=0, worker=0, num_workers=1):
+        """Computes the items of every batch of an epoch.
+
+        Parameters
+        ----------
+        partition:
+            The index of the partition, by default 0
+        num_partitions:
+            The number of partitions, by default 1
+        epoch:
+            The epoch, by default 0
+        worker:
+            The index of the worker within the partition, by default 0
+        num_workers:
+            The number of workers of every partition, by default 1
+
+        Returns
+        -------
+        list
+            The ``(shard, row)`` index array of every batch.
+        """
+        order = None
+        if self.shuffle:
+            rng = np.random.default_rng([self.random_seed, epoch])
+            order = rng.permutation(len(self.sizes))
+        pieces = partition_shards(
+            self.sizes, partition, num_partitions, order, worker, num_workers
+        )
+        if len(pieces) == 0:
+            return []
+        plan = np.concatenate(
+            [
+                np.stack([np.full(stop - start, i), np.arange(start, stop)], axis=1)
+                for i, start, stop in pieces
+            ]
+        )
+        part = partition * num_workers + worker
+        rng = np.random.default_rng([self.random_seed, epoch, part + 1])
+        if self.shuffle and self.shuffle_buffer > 0:
+            plan = plan[shuffle_buffer_order(len(plan), self.shuffle_buffer, rng)]
+        if self.max_tokens:
+            return self._bucket(plan, rng)
+        batch_size = self.batch_size or len(plan)
+        return [plan[i : i + batch_size] for i in range(0, len(plan), batch_size)]
+
+    def _bucket(self, plan, rng):
+        offsets = np.concatenate([[0], np.cumsum(self.sizes)])
+        lengths = self.lengths[offsets[plan[:, 0]] + plan[:, 1]]
+        bucket_size = self.bucket_size or len(plan)
+        batches = []
+        for start in range(0, len(plan), bucket_size):
+            order = np.argsort(lengths[start : start + bucket_size], kind="stable")
+            bucket = plan[start : start + bucket_size][order]
+            bounds = token_batches(
+                lengths[start : start + bucket_size][order],
+                self.max_tokens,
+                self.batch_size,
+            )
+            batches.extend(bucket[a:b] for a, b in zip(bounds[:-1], bounds[1:]))
+        if self.shuffle:
+            # batches are sorted by length, shuffle them to mix lengths over the epoch
+            batches = [batches[b] for b in rng.permutation(len(batches))]
+        return batches
+
+    def __call__(
+        self,
+        partition=0,
+        num_partitions=1,
+        epoch=None,
+        skip=None,
+        worker=0,
+        num_workers=1,
+    ):
+        """Iterates the batches of an epoch.
+
+        Parameters
+        ----------
+        partition:
+            The index of the partition, by default 0
+        num_partitions:
+            The number of partitions, by default 1
+        epoch:
+            The epoch, by default None (the epoch of ``state_dict``, which advances after every completed iteration)
+        skip:
+            The number of batches to skip, by default None (the batches of ``state_dict``)
+        worker:
+            The index of the worker within the partition, by default 0
+        num_workers:
+            The number of workers of every partition, by default 1
+
+        Yields
+        ------
+        tuple
+            The batches.
+        """
+        if epoch is None:
+            epoch, skip = self.epoch, self.batches if skip is None else skip
+        self.epoch, self.batches = epoch, skip or 0
+        start = self.batches
+        batches = self.plan(partition, num_partitions, epoch, worker, num_workers)
+        batches = batches[start:]
+        part = partition * num_workers + worker
+        offsets = np.concatenate([[0], np.cumsum(self.sizes)])
+
+        def jobs():
+            for b, batch in enumerate(batches, start):
+                position = np.arange(len(batch))
+                if self.shuffle and self.shuffle_buffer == 0:
+                    rng = np.random.default_rng([self.random_seed, epoch, part + 1, b])
+                    position = np.argsort(rng.permutation(len(batch)))
+                seeds = np.empty(len(batch), dtype=np.uint64)
+                seeds[position] = sample_seeds(
+                    self.random_seed, epoch, offsets[batch[:, 0]] + batch[:, 1]
+                )
+                yield batch, position, seeds
+
+        if self.batch_workers > 0:
+            outputs = self._pooled(jobs())
+        else:
+            outputs = self._local(jobs(), batches)
+        if self.stats is not None:
+            outputs = self.stats.iterate(outputs)
+        try:
+            for output in outputs:
+                self.batches += 1
+                yield output
+            self.epoch, self.batches = epoch + 1, 0
+        finally:
+            outputs.close()
+            if self.stats is not None and self.stats.path is not None:
+                self.stats.save()
+
+    def _local(self, jobs, batches):
+        # shards in the order of their first use, and the batch of their last use
+        ids = [np.unique(batch[:, 0]).tolist() for batch in batches]
+        first, last = {}, {}
+        for b, batch_ids in enumerate(ids):
+            for i in batch_ids:
+                first.setdefault(i, b)
+                last[i] = b
+        # prefetched shards are read into memory, such that no I/O is left for the consumer
+        shards = (
+            (i, _load(self.path / str(i), self.prefetch == 0, self.stats))
+            for i in sorted(first, key=first.get)
+        )
+        if self.prefetch > 0:
+            shards = prefetched(shards, self.prefetch)
+        loaded = {}
+        try:
+            for b, (batch, position, seeds) in enumerate(jobs):
+                while not all(i in loaded for i in ids[b]):
+                    i, shard = next(shards)
+                    loaded[i] = shard
+                output = _assemble(loaded, batch, position)
+                for i in ids[b]:
+                    if last[i] == b:
+                        del loaded[i]
+                yield (
+                    output if self.transform is None else self.transform(output, seeds)
+                )
+        finally:
+            shards.close()
+
+    def _pooled(self, jobs):
+        executor = ProcessPoolExecutor(
+            self.batch_workers,
+            initializer=_init_worker,
+            initargs=(self.path, self.transform, self.stats is not None),
+        )
+        pending = deque()
+
+        def receive(future):
+            # the time spent waiting for the workers
+            with measure("batch wait"):
+                tree, name, state = future.result()
+            if state is not None:
+                self.stats.merge(state)
+            return from_shared(tree, name)
+
+        try:
+            for job in jobs:
+                pending.append(executor.submit(_process_batch, *job))
+                if len(pending) >= 2 * self.batch_workers:
+                    yield receive(pending.popleft())
+            while pending:
+                yield receive(pending.popleft())
+        finally:
+            # release the shared memory of batches that were computed but not consumed
+            for future in pending:
+                if not future.cancel():
+                    try:
+                        from_shared(*future.result()[:2])
+                    except Exception:
+                        pass
+            executor.shutdown()
+
+    def __iter__(self):
+        return self()
+
+    def state_dict(self):
+        """Returns the cursor of the iteration, i.e. the current epoch and the number of batches consumed in it."""
+        return {"epoch": self.epoch, "batches": self.batches}
+
+    def load_state_dict(self, state):
+        """Resumes the iteration at a cursor returned by ``state_dict``."""
+        self.epoch, self.batches = state["epoch"], state["batches"]
@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from itertools import islice
+from queue import Queue, Full
+from threading import Thread, Event
+
+
+def parallel_map(function, iterable, num_workers, ordered=True, max_pending=None):
+    """Lazily applies a function to the elements of an iterable in a process pool.
+    At most ``max_pending`` elements are submitted at a time, such that memory stays bounded for long iterables. Pending work is cancelled when the consumer stops early.
+
+    Parameters
+    ----------
+    function:
+        A picklable function.
+    iterable:
+        The function arguments.
+    num_workers:
+        The number of worker processes.
+    ordered:
+        Whether to yield the results in the order of the iterable, or as they complete.
+    max_pending:
+        The maximum number of submitted but not yet consumed elements, by default 2 * num_workers.
+
+    Yields
+    ------
+    object
+        The function results.
+    """
+    max_pending = max_pending or 2 * num_workers
+    iterator = iter(iterable)
+    with ProcessPoolExecutor(num_workers) as pool:
+        pending = deque(pool.submit(function, x) for x in islice(iterator, max_pending))
+        try:
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                for future in done:
+                    for x in islice(iterator, 1):
+                        pending.append(pool.submit(function, x))
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def prefetched(iterable, size):
+    """Iterates an iterable in a background thread, keeping up to ``size`` elements ready ahead of the consumer.
+    The thread stops when the consumer stops early (i.e. when the returned generator is closed), and exceptions of the iterable are re-raised in the consumer.
+
+    Parameters
+    ----------
+    iterable:
+        The iterable, e.g. a generator that loads files.
+    size:
+        The maximum number of elements loaded ahead.
+
+    Yields
+    ------
+    object
+        The elements of the iterable.
+    """
+    queue, stop, done = Queue(maxsize=size), Event(), object()
+
+    def put(element):
+        # block until there is space or the consumer stopped
+        while not stop.is_set():
+            try:
+                queue.put(element, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for element in iterable:
+                if not put((element, None)):
+                    return
+            put((done, None))
+        except BaseException as exception:
+            put((done, exception))
+
+    thread = Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            element, exception = queue.get()
+            if exception is not None:
+                raise exception
+            if element is done:
+                return
+            yield element
+    finally:
+        stop.set()
+        thread.join()
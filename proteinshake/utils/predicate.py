@@ -0,0 +1,153 @@
+import numpy as np
+
+# the block statistic of the protein length, reserved such that it does not collide with a protein field
+LENGTH = "__length__"
+
+
+def protein_length(protein):
+    """The number of residues of a protein dictionary."""
+    return len(protein["sequence"])
+
+
+class BlockStatistics:
+    """Accumulates statistics of the proteins in a block, which are used to skip blocks that cannot match a ``Predicate``.
+    Records the minimum and maximum of numeric fields and of the protein length (under the reserved name ``__length__``), and the value counts of string fields with few, short distinct values (such as the split).
+    """
+
+    max_values = 32
+    max_value_length = 32
+
+    def __init__(self):
+        self.stats = {}
+
+    def update(self, protein):
+        """Adds a protein to the statistics.
+
+        Parameters
+        ----------
+        protein : Dict
+            A protein dictionary.
+        """
+        values = {
+            name: value
+            for name, value in protein.items()
+            if isinstance(value, (str, int, float, np.number))
+        }
+        if "sequence" in protein:
+            values[LENGTH] = protein_length(protein)
+        for name, value in values.items():
+            if isinstance(value, str):
+                counts = self.stats.setdefault(name, {"values": {}})["values"]
+                if counts is not None:
+                    counts[value] = counts.get(value, 0) + 1
+                    if (
+                        len(counts) > self.max_values
+                        or len(value) > self.max_value_length
+                    ):
+                        self.stats[name]["values"] = None
+            else:
+                value = value.item() if isinstance(value, np.number) else value
+                stats = self.stats.setdefault(name, {"min": value, "max": value})
+                stats["min"] = min(stats["min"], value)
+                stats["max"] = max(stats["max"], value)
+
+    def pop(self):
+        """Returns the statistics and resets the accumulator for the next block."""
+        stats, self.stats = self.stats, {}
+        return {
+            name: value
+            for name, value in stats.items()
+            if value.get("values", {}) is not None
+        }
+
+
+class Predicate:
+    """A conjunction of conditions on protein fields, used to filter a dataset.
+    Conditions are given as a dictionary mapping a field to either a value (equality), a list or set of values (membership), or a ``(min, max)`` tuple (inclusive range, use None for an open end).
+    The virtual field ``length`` refers to the number of residues in the protein sequence, unless the proteins have a field of that name.
+    Blocks whose statistics cannot be compared with a condition, e.g. a string threshold on a numeric field, are not skipped.
+    """
+
+    def __init__(self, where, fields=None):
+        """
+
+        Parameters
+        ----------
+        where : Dict
+            The conditions, e.g. ``{"split": "train", "length": (50, 500)}``.
+        fields : List[str], optional
+            The fields of the proteins, by default None (``length`` is the virtual field)
+        """
+        self.where = dict(where)
+        self.virtual_length = fields is None or "length" not in fields
+
+    def _virtual(self, name):
+        return name == "length" and self.virtual_length
+
+    @property
+    def fields(self):
+        """The protein fields needed to evaluate the predicate."""
+        return ["sequence" if self._virtual(name) else name for name in self.where]
+
+    @staticmethod
+    def _test(condition, value):
+        if isinstance(condition, tuple):
+            low, high = condition
+            return (low is None or value >= low) and (high is None or value <= high)
+        if isinstance(condition, (list, set, frozenset)):
+            return value in condition
+        return value == condition
+
+    def __call__(self, protein):
+        """Checks whether a protein satisfies all conditions.
+
+        Parameters
+        ----------
+        protein : Dict
+            A protein dictionary.
+
+        Returns
+        -------
+        bool
+            The result of the check.
+        """
+        for name, condition in self.where.items():
+            value = protein_length(protein) if self._virtual(name) else protein[name]
+            if not self._test(condition, value):
+                return False
+        return True
+
+    def may_match(self, stats):
+        """Checks whether a block with the given statistics may contain matching proteins.
+
+        Parameters
+        ----------
+        stats : Dict
+            The block statistics, as computed by ``BlockStatistics``.
+
+        Returns
+        -------
+        bool
+            False if no protein in the block can match.
+        """
+        for name, condition in self.where.items():
+            name = LENGTH if self._virtual(name) else name
+            try:
+                if name in stats and not self._may_match(condition, stats[name]):
+                    return False
+            except TypeError:
+                # the condition has another type than the field
+                continue
+        return True
+
+    def _may_match(self, condition, stats):
+        if "values" in stats:
+            return any(self._test(condition, value) for value in stats["values"])
+        low, high = stats["min"], stats["max"]
+        if isinstance(condition, tuple):
+            return (condition[0] is None or condition[0] <= high) and (
+                condition[1] is None or condition[1] >= low
+            )
+        if isinstance(condition, (list, set, frozenset)):
+            return any(low <= value <= high for value in condition)
+        return low <= condition <= high
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def splitmix64(x):
+    """The splitmix64 mixing function, applied elementwise to an array of unsigned 64 bit integers.
+
+    Parameters
+    ----------
+    x:
+        The input integers.
+
+    Returns
+    -------
+    ndarray
+        The mixed uint64 integers.
+    """
+    # the arithmetic is modulo 2**64, overflows are intended
+    with np.errstate(over="ignore"):
+        z = np.asarray(x, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def sample_seeds(random_seed, epoch, indices):
+    """Derives a seed for every sample from the random seed, the epoch, and the global index of the sample.
+    The seeds do not depend on batching, shuffling, or the worker that processes a sample, such that stochastic transforms are reproducible.
+
+    Parameters
+    ----------
+    random_seed:
+        The random seed of the loader.
+    epoch:
+        The epoch.
+    indices:
+        The global indices of the samples in the split.
+
+    Returns
+    -------
+    ndarray
+        The uint64 seeds.
+    """
+    key = np.random.SeedSequence([random_seed, epoch]).generate_state(1, np.uint64)[0]
+    return splitmix64(splitmix64(indices) ^ key)
+
+
+def stream_uniform(seeds, counters):
+    """Counter-based uniform random numbers in [0, 1). The number at position ``counter`` of the stream of ``seed`` depends on nothing else, so every sample can draw from its own stream in a single vectorised call. Seeds and counters are broadcast against each other.
+
+    Parameters
+    ----------
+    seeds:
+        The uint64 seeds of the streams.
+    counters:
+        The positions in the streams.
+
+    Returns
+    -------
+    ndarray
+        The float64 random numbers.
+    """
+    bits = splitmix64(splitmix64(counters) ^ np.asarray(seeds, dtype=np.uint64))
+    return (bits >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def stream_normal(seeds, counters):
+    """Counter-based standard normal random numbers, from the uniforms at positions ``2 * counter`` and ``2 * counter + 1`` (Box-Muller).
+
+    Parameters
+    ----------
+    seeds:
+        The uint64 seeds of the streams.
+    counters:
+        The positions in the streams.
+
+    Returns
+    -------
+    ndarray
+        The float64 random numbers.
+    """
+    counters = np.asarray(counters, dtype=np.uint64) * np.uint64(2)
+    radius = np.sqrt(-2.0 * np.log(1.0 - stream_uniform(seeds, counters)))
+    return radius * np.cos(2 * np.pi * stream_uniform(seeds, counters + np.uint64(1)))
@@ -0,0 +1,521 @@
+from itertools import islice, chain
+from collections import deque
+from pathlib import Path
+import hashlib, json, os, pickle
+import numpy as np
+from .io import save, load
+from .stats import measure, profiled
+
+
+def make_shard(items):
+    """Converts a list of Xy tuples into a shard of X and y object arrays.
+
+    Parameters
+    ----------
+    items:
+        A list of ``((X1, X2, ...), y)`` tuples.
+
+    Returns
+    -------
+    tuple
+        The X and y arrays.
+    """
+    X, y = list(zip(*items))
+    return np.asarray(X, dtype=object), np.asarray(y, dtype=object)
+
+
+def item_lengths(shard):
+    """Computes the length of every item of a shard, i.e. the number of residues of its first input.
+    The input may be a protein dictionary (length of the sequence, or of the coordinates), an array or sequence (its length), or padded numeric arrays of shape ``(n, k, length, ...)``.
+
+    Parameters
+    ----------
+    shard:
+        The X and y arrays.
+
+    Returns
+    -------
+    ndarray
+        The lengths.
+    """
+    X = shard[0]
+    if X.dtype != object:
+        return np.full(len(X), X.shape[2] if X.ndim > 2 else 1, dtype=np.int64)
+    inputs = X[:, 0] if X.ndim > 1 else X
+
+    def length(x):
+        if isinstance(x, dict):
+            return len(x["sequence"] if "sequence" in x else x.get("coords", ()))
+        return len(x) if hasattr(x, "__len__") else 1
+
+    return np.asarray([length(x) for x in inputs], dtype=np.int64)
+
+
+def sharded(iterator, shard_size):
+    while shard := list(islice(iterator, shard_size)):
+        yield make_shard(shard)
+
+
+# byte alignment of the buffers in numeric shard files
+ALIGNMENT = 64
+
+
+def _numeric(dtype):
+    return dtype.kind in "biuf"
+
+
+def densify(array):
+    """Converts an object array of numeric scalars (e.g. labels) to a numeric array, and returns other arrays unchanged."""
+    if array.dtype != object or array.size == 0:
+        return array
+    if not all(
+        isinstance(item, (bool, int, float, np.bool_, np.number))
+        for item in array.ravel()
+    ):
+        return array
+    dense = np.asarray(array.tolist())
+    return dense if _numeric(dense.dtype) and dense.shape == array.shape else array
+
+
+def _encode_array(array):
+    # returns the header and buffers of an array, or None if it is not numeric
+    array = densify(array)
+    if _numeric(array.dtype):
+        return {"kind": "dense", "dtype": array.dtype.str, "shape": array.shape}, [
+            array
+        ]
+    if array.dtype != object or array.size == 0:
+        return None
+    items = array.ravel()
+    if not all(isinstance(item, np.ndarray) and item.ndim > 0 for item in items):
+        return None
+    dtype, inner = items[0].dtype, items[0].shape[1:]
+    if not _numeric(dtype) or any(
+        item.dtype != dtype or item.shape[1:] != inner for item in items
+    ):
+        return None
+    offsets = np.cumsum([0] + [len(item) for item in items]).astype(np.int64)
+    header = {
+        "kind": "ragged",
+        "dtype": dtype.str,
+        "shape": array.shape,
+        "inner": inner,
+        "length": int(offsets[-1]),
+    }
+    return header, [np.concatenate(items), offsets]
+
+
+def _encode_shard(shard):
+    headers, buffers = [], []
+    for array in shard:
+        encoded = (
+            _encode_array(np.asarray(array)) if isinstance(array, np.ndarray) else None
+        )
+        if encoded is None:
+            return None
+        headers.append(encoded[0])
+        buffers.extend(encoded[1])
+    return headers, buffers
+
+
+def _align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def _write(path, chunks):
+    # write to a temporary file first, such that a shard file is never incomplete
+    sha256, size = hashlib.sha256(), 0
+    with open(path.with_suffix(".tmp"), "wb") as file:
+        for chunk in chunks:
+            file.write(chunk)
+            sha256.update(chunk)
+            size += len(chunk)
+    os.replace(path.with_suffix(".tmp"), path)
+    return {
+        "shard": int(path.stem),
+        "file": path.name,
+        "size": size,
+        "sha256": sha256.hexdigest(),
+    }
+
+
+def _save_shard(shard, path):
+    """Saves a shard as ``{i}.bin`` if all its arrays are numeric or ragged numeric, otherwise as ``{i}.pkl``.
+    A ``.bin`` file starts with the length of a JSON header (8 bytes, little endian), followed by the header and the aligned raw buffers of the arrays. Ragged arrays are stored as concatenated values and offsets.
+    """
+    path = Path(path)
+    for suffix in [".bin", ".pkl"]:
+        if os.path.exists(path.with_suffix(suffix)):
+            os.remove(path.with_suffix(suffix))
+    encoded = _encode_shard(shard) if isinstance(shard, tuple) else None
+    if encoded is None:
+        data = pickle.dumps(shard, protocol=pickle.HIGHEST_PROTOCOL)
+        return _write(path.with_suffix(".pkl"), [data])
+    headers, buffers = encoded
+    # buffer offsets are relative to the (aligned) end of the header
+    spans, offset = [], 0
+    for buffer in buffers:
+        spans.append(offset)
+        offset = _align(offset + buffer.nbytes)
+    header = json.dumps({"arrays": headers, "buffers": spans}).encode()
+
+    def chunks():
+        yield np.array([len(header)], dtype="<u8").tobytes() + header
+        position = 8 + len(header)
+        start = _align(position)
+        for span, buffer in zip(spans, buffers):
+            yield bytes(start + span - position)
+            yield np.ascontiguousarray(buffer).tobytes()
+            position = start + span + buffer.nbytes
+
+    return _write(path.with_suffix(".bin"), chunks())
+
+
+def load_shard(path, mmap=True):
+    """Loads a shard saved by a ``ShardWriter``.
+    Numeric shards are memory mapped, such that batches can be sliced without reading or deserializing the whole shard, and concurrent processes share the page cache. Ragged arrays are returned as object arrays of views into the mapped values.
+
+    Parameters
+    ----------
+    path:
+        The path of the shard file, without suffix (e.g. ``shards/0``).
+    mmap:
+        Whether to memory map numeric shards read-only, by default True. Otherwise the shard is read into writable memory.
+
+    Returns
+    -------
+    tuple
+        The X and y arrays.
+    """
+    path = Path(path)
+    if not os.path.exists(path.with_suffix(".bin")):
+        return load(path.with_suffix(".pkl"))
+    path = path.with_suffix(".bin")
+    with open(path, "rb") as file:
+        length = int(np.frombuffer(file.read(8), dtype="<u8")[0])
+        header = json.loads(file.read(length))
+        data = None if mmap else bytearray(file.read())
+    spans = iter(header["buffers"])
+    start = _align(8 + length)
+
+    def buffer(dtype, shape):
+        offset = start + next(spans)
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        offset -= 8 + length
+        return np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(
+            shape
+        )
+
+    arrays = []
+    for array in header["arrays"]:
+        if array["kind"] == "dense":
+            arrays.append(buffer(array["dtype"], tuple(array["shape"])))
+            continue
+        values = buffer(array["dtype"], (array["length"], *array["inner"]))
+        offsets = buffer("<i8", (int(np.prod(array["shape"])) + 1,))
+        items = np.empty(len(offsets) - 1, dtype=object)
+        for j, (low, high) in enumerate(zip(offsets[:-1], offsets[1:])):
+            items[j] = values[low:high]
+        arrays.append(items.reshape(array["shape"]))
+    return tuple(arrays)
+
+
+def partition_shards(
+    sizes, partition=0, num_partitions=1, order=None, worker=0, num_workers=1
+):
+    """Assigns a contiguous range of items to one of several partitions (e.g. distributed ranks), and to one of the workers of a partition (e.g. data loader workers).
+    All partitions get the same number of items. To this end, the items are padded by wrapping around to the first ones, as in ``torch.utils.data.DistributedSampler``. The range of a partition is split among its workers without padding, such that the workers of a partition together iterate every item of it exactly once.
+
+    Parameters
+    ----------
+    sizes:
+        The number of items of each shard.
+    partition:
+        The index of the partition, by default 0
+    num_partitions:
+        The number of partitions, by default 1
+    order:
+        The order in which the shards are concatenated, by default None (by shard index)
+    worker:
+        The index of the worker within the partition, by default 0
+    num_workers:
+        The number of workers of every partition, by default 1
+
+    Returns
+    -------
+    list
+        ``(shard, start, stop)`` tuples of the item ranges of the worker.
+    """
+    order = np.arange(len(sizes)) if order is None else np.asarray(order)
+    sizes = np.asarray(sizes, dtype=np.int64)[order]
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    total = int(ends[-1]) if len(ends) > 0 else 0
+    if total == 0:
+        return []
+    per_partition = -(-total // num_partitions)
+    # the first workers get one item more if the partition does not split evenly
+    per_worker, remainder = divmod(per_partition, num_workers)
+    start = partition * per_partition + worker * per_worker + min(worker, remainder)
+    stop = start + per_worker + int(worker < remainder)
+    pieces = []
+    while start < stop:
+        wrapped = (start // total) * total
+        low, high = start - wrapped, min(stop - wrapped, total)
+        for k in np.nonzero((starts < high) & (ends > low))[0]:
+            pieces.append(
+                (
+                    int(order[k]),
+                    int(max(low, starts[k]) - starts[k]),
+                    int(min(high, ends[k]) - starts[k]),
+                )
+            )
+        start = wrapped + high
+    return pieces
+
+
+def _process_shard(stages, start, i, shard=None):
+    if shard is None:
+        with measure("shard read") as counts:
+            shard = load_shard(stages[start][0] / str(i), mmap=False)
+            counts["items"] = len(shard[0])
+    entries = []
+    for j in range(start + 1, len(stages)):
+        path, transform = stages[j]
+        if transform is not None:
+            shard = transform(shard)
+        with measure("shard write", items=len(shard[0])) as counts:
+            entry = _save_shard(shard, path / str(i))
+            counts["bytes"] = entry["size"]
+        entry = {
+            **entry,
+            "items": len(shard[0]),
+            "lengths": item_lengths(shard).tolist(),
+        }
+        entries.append((j, entry))
+    return entries
+
+
+def shard_manifest(path):
+    """Reads the manifest of a shard directory.
+
+    Parameters
+    ----------
+    path:
+        The shard directory.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping shard numbers to their size and sha256 checksum.
+    """
+    manifest = {}
+    if not os.path.exists(Path(path) / "manifest.jsonl"):
+        return manifest
+    with open(Path(path) / "manifest.jsonl", "r") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:  # interrupted while writing
+                continue
+            manifest[entry["shard"]] = entry
+    return manifest
+
+
+def valid_shards(path, verify=False):
+    """Finds the shards of a directory that were completely written and are unchanged since.
+
+    Parameters
+    ----------
+    path:
+        The shard directory.
+    verify:
+        Whether to compare checksums, by default False (only compares file sizes).
+
+    Returns
+    -------
+    set
+        The numbers of the valid shards.
+    """
+    path = Path(path)
+    valid = set()
+    for i, entry in shard_manifest(path).items():
+        file = path / entry.get("file", f"{i}.pkl")
+        if not os.path.exists(file) or os.path.getsize(file) != entry["size"]:
+            continue
+        if verify:
+            with open(file, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != entry["sha256"]:
+                    continue
+        valid.add(i)
+    return valid
+
+
+def is_complete(path, verify=False):
+    """Checks whether a shard directory was completely written and all shards are valid.
+
+    Parameters
+    ----------
+    path:
+        The shard directory.
+    verify:
+        Whether to compare checksums, by default False (only compares file sizes).
+
+    Returns
+    -------
+    bool
+        The result of the check.
+    """
+    path = Path(path)
+    if not os.path.exists(path / ".complete"):
+        return False
+    num_shards = len(np.load(path / "index.npy"))
+    return valid_shards(path, verify) >= set(range(num_shards))
+
+
+class ShardWriter:
+    """Collects Xy tuples into shards and passes every shard through a chain of stages as soon as it is full, such that at most one shard is kept in memory.
+    Each stage is a directory and a transform. The output of every stage is saved as ``{i}.bin`` or ``{i}.pkl`` files (see ``load_shard``) in its directory and recorded with its size and checksum in ``manifest.jsonl``. Stages that have all shards get the shard index ``index.npy``, the number of items per shard ``sizes.npy``, the length of every item ``lengths.npy`` (see ``item_lengths``), and the ``.complete`` marker on ``close``.
+    Every shard resumes from the last stage that already holds a valid copy of it, such that only missing or corrupt shards are computed.
+    If an executor is given, shards are processed in its worker processes, with at most ``max_pending`` shards in flight. Shard numbering does not depend on the executor.
+    As a context manager, the writer is closed when the block ends, or aborted if it raises, such that no manifest stays open.
+    """
+
+    def __init__(
+        self,
+        stages,
+        shard_size,
+        executor=None,
+        max_pending=2,
+        verify=False,
+        stats=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        stages:
+            A list of ``(path, transform)`` tuples. The transforms are picklable functions applied to the shards, or None.
+        shard_size:
+            The number of items per shard.
+        executor:
+            A ``concurrent.futures`` executor to process the shards in, by default None
+        max_pending:
+            The maximum number of shards submitted to the executor and not yet saved, by default 2
+        verify:
+            Whether to compare checksums of existing shards instead of only their sizes, by default False
+        stats:
+            The ``Stats`` to merge the measurements of the executor's workers into, by default None
+        """
+        self.stages = [(Path(path), transform) for path, transform in stages]
+        self.shard_size = shard_size
+        self.executor = executor
+        self.max_pending = max_pending
+        self.stats = stats
+        self.pending = deque()
+        self.buffer = []
+        self.num_shards = 0
+        self.valid, self.manifests = [], []
+        try:
+            for path, _ in self.stages:
+                os.makedirs(path, exist_ok=True)
+                self.valid.append(valid_shards(path, verify))
+                self.manifests.append(open(path / "manifest.jsonl", "a"))
+        except BaseException:
+            self.abort()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _record(self, entries):
+        if self.stats is not None and self.executor is not None:
+            entries, state = entries
+            self.stats.merge(state)
+        for j, entry in entries:
+            self.manifests[j].write(json.dumps(entry) + "\n")
+            self.manifests[j].flush()
+            self.valid[j].add(entry["shard"])
+
+    def _process(self, i, items=None):
+        start = max([j for j, valid in enumerate(self.valid) if i in valid], default=-1)
+        if start == len(self.stages) - 1:
+            return
+        if start < 0 and items is None:
+            raise ValueError(f"Shard {i} is neither cached nor given.")
+        shard = make_shard(items) if start < 0 else None
+        if self.executor is None:
+            self._record(_process_shard(self.stages, start, i, shard))
+            return
+        while len(self.pending) >= self.max_pending:
+            self._record(self.pending.popleft().result())
+        args = (_process_shard, self.stages, start, i, shard)
+        if self.stats is not None:
+            args = (profiled, *args)
+        self.pending.append(self.executor.submit(*args))
+
+    def append(self, item):
+        """Adds an Xy tuple, and processes the current shard if it is full."""
+        self.buffer.append(item)
+        if len(self.buffer) == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """Processes the buffered items as a shard."""
+        if len(self.buffer) == 0:
+            return
+        self._process(self.num_shards, self.buffer)
+        self.buffer = []
+        self.num_shards += 1
+
+    def resume(self, num_shards):
+        """Processes all shards from their cached stages, without any items being appended.
+
+        Parameters
+        ----------
+        num_shards:
+            The number of shards. Every shard needs a valid copy in at least one stage.
+        """
+        for i in range(num_shards):
+            self._process(i)
+        self.num_shards = num_shards
+
+    def abort(self):
+        """Closes the manifests without completing the stages, e.g. after a transform failed. Pending shards are cancelled."""
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        for manifest in self.manifests:
+            manifest.close()
+
+    def close(self):
+        """Processes the remaining items, waits for pending shards, and completes the stages."""
+        try:
+            self.flush()
+            while self.pending:
+                self._record(self.pending.popleft().result())
+        except BaseException:
+            self.abort()
+            raise
+        for manifest in self.manifests:
+            manifest.close()
+        for (path, _), valid in zip(self.stages, self.valid):
+            if valid >= set(range(self.num_shards)):
+                entries = shard_manifest(path)
+                sizes = [entries[i]["items"] for i in range(self.num_shards)]
+                save(np.asarray(sizes, dtype=np.int64), path / "sizes.npy")
+                lengths = (entries[i]["lengths"] for i in range(self.num_shards))
+                lengths = np.fromiter(chain.from_iterable(lengths), dtype=np.int64)
+                save(lengths, path / "lengths.npy")
+                save(np.arange(self.num_shards), path / "index.npy")
+                open(path / ".complete", "w").close()
@@ -0,0 +1,209 @@
+import os, sys, json, threading
+from time import perf_counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# the stats that measurements are recorded in, None if recording is off
+_active = None
+
+
+def peak_memory():
+    """The peak resident memory of the current process, in bytes (0 if unknown)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stats:
+    """Records the time, the number of items and the number of bytes of the stages of a pipeline, and the peak memory.
+    Recording is opt-in: stages are only measured (see ``measure``) while a ``Stats`` object is active, i.e. within ``with stats:``. Time spent in a nested stage is only counted for the inner stage, such that the times of all stages add up to the total time. Stages measured in other threads are counted in parallel.
+    """
+
+    def __init__(self, path=None):
+        """
+
+        Parameters
+        ----------
+        path:
+            The path of the JSON report written by ``save``, by default None
+        """
+        self.path = path
+        self.stages = {}
+        self.peak_memory = 0
+        self.peak_worker_memory = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._previous = []
+
+    def __enter__(self):
+        global _active
+        self._previous.append(_active)
+        _active = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self._previous.pop()
+        self.peak_memory = max(self.peak_memory, peak_memory())
+
+    def __getstate__(self):
+        # locks cannot be pickled, e.g. when a loader is sent to a worker process
+        return {
+            key: value
+            for key, value in vars(self).items()
+            if key not in ["_lock", "_local"]
+        }
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def record(self, stage, seconds, items=0, nbytes=0, calls=1):
+        """Adds a measurement to a stage."""
+        with self._lock:
+            entry = self.stages.setdefault(
+                stage, {"calls": 0, "seconds": 0.0, "items": 0, "bytes": 0}
+            )
+            entry["calls"] += calls
+            entry["seconds"] += seconds
+            entry["items"] += items
+            entry["bytes"] += nbytes
+
+    def iterate(self, iterable):
+        """Iterates an iterable with the stats active while producing each element, e.g. a lazy loader that is consumed outside of ``with stats:``."""
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self:
+                    try:
+                        element = next(iterator)
+                    except StopIteration:
+                        return
+                yield element
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def state_dict(self):
+        """Returns the recorded measurements, e.g. to pass them from a worker process to ``merge``."""
+        return {
+            "stages": self.stages,
+            "peak_memory": max(self.peak_memory, peak_memory()),
+        }
+
+    def merge(self, state):
+        """Adds the measurements of a worker process returned by ``state_dict``. Its peak memory is counted as worker memory."""
+        for stage, entry in state["stages"].items():
+            self.record(
+                stage, entry["seconds"], entry["items"], entry["bytes"], entry["calls"]
+            )
+        self.peak_worker_memory = max(self.peak_worker_memory, state["peak_memory"])
+
+    def report(self):
+        """Summarizes the measurements.
+
+        Returns
+        -------
+        dict
+            The calls, seconds, items, bytes, items per second and MB per second of every stage, the total time, and the peak memory of the process and the workers in bytes.
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    **entry,
+                    "items_per_second": entry["items"] / max(entry["seconds"], 1e-9),
+                    "mb_per_second": entry["bytes"] / 1e6 / max(entry["seconds"], 1e-9),
+                }
+                for stage, entry in self.stages.items()
+            }
+        return {
+            "stages": stages,
+            "seconds": sum(entry["seconds"] for entry in stages.values()),
+            "peak_memory": max(self.peak_memory, peak_memory()),
+            "peak_worker_memory": self.peak_worker_memory,
+        }
+
+    def save(self, path=None):
+        """Writes the report as JSON.
+
+        Parameters
+        ----------
+        path:
+            The path of the report, by default None (the path given on construction)
+        """
+        path = path or self.path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+@contextmanager
+def measure(stage, items=0, nbytes=0, stats=None):
+    """Measures the time of a block as a stage of the active stats. Does nothing if no stats are active.
+    Yields a dictionary whose ``items`` and ``bytes`` can be updated in the block, e.g. when they are only known afterwards.
+
+    Parameters
+    ----------
+    stage:
+        The name of the stage.
+    items:
+        The number of items processed, by default 0
+    nbytes:
+        The number of bytes processed, by default 0
+    stats:
+        The stats to record in, by default None (the active stats)
+    """
+    stats = stats or _active
+    counts = {"items": items, "bytes": nbytes}
+    if stats is None:
+        yield counts
+        return
+    stack = stats._stack()
+    stack.append(0.0)
+    start = perf_counter()
+    try:
+        yield counts
+    finally:
+        elapsed = perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        stats.record(stage, elapsed - nested, counts["items"], counts["bytes"])
+
+
+def measured(iterable, stage):
+    """Measures the time to produce every element of an iterable as a stage of the active stats, e.g. decoding."""
+    iterator = iter(iterable)
+    while True:
+        with measure(stage) as counts:
+            try:
+                element = next(iterator)
+            except StopIteration:
+                return
+            counts["items"] = 1
+        yield element
+
+
+def profiled(function, *args, **kwargs):
+    """Calls a function with fresh stats active, e.g. in a worker process.
+
+    Returns
+    -------
+    tuple
+        The result of the function and the ``state_dict`` of the stats, to be merged into the stats of the calling process.
+    """
+    with Stats() as stats:
+        result = function(*args, **kwargs)
+    return result, stats.state_dict()
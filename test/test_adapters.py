@@ -0,0 +1,248 @@
+import unittest, tempfile, os, io, gzip, bz2, lzma, tarfile, zipfile
+from unittest import mock
+import numpy as np
+from proteinshake.adapters import LocalAdapter, SyntheticAdapter
+from proteinshake.dataset import Dataset
+from proteinshake.utils import load
+from proteinshake.processor import Processor
+from proteinshake.modifiers import RandomSplit
+
+PDB = """\
+ATOM      1  N   MET A   1      11.104  13.207   2.100  1.00 20.00           N
+ATOM      2  CA  MET A   1      12.560  13.207   2.100  1.00 20.00           C
+ATOM      3  N   GLY A   2      13.104  14.207   3.100  1.00 20.00           N
+ATOM      4  CA  GLY A   2      14.560  14.207   3.100  1.00 20.00           C
+END
+"""
+
+# two models, an alternate location, an insertion code and a water
+MODELS = """\
+MODEL        1
+ATOM      1  CA  MET A   1      11.104  13.207   2.100  1.00 20.00           C
+ATOM      2  CA AGLY A   2      12.560  13.207   2.100  0.50 20.00           C
+ATOM      3  CA BGLY A   2      12.960  13.207   2.100  0.50 20.00           C
+ATOM      4  CA  MSE A   2A     13.104  14.207   3.100  1.00 20.00           C
+ATOM      5  CA  TRP B   7      14.560  14.207   3.100  1.00 20.00           C
+HETATM    6  O   HOH A 100       1.000   2.000   3.000  1.00 20.00           O
+ENDMDL
+MODEL        2
+ATOM      1  CA  MET A   1      21.104  13.207   2.100  1.00 20.00           C
+ENDMDL
+END
+"""
+
+CIF = """\
+data_TEST
+_entry.id TEST
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_asym_id
+_atom_site.pdbx_PDB_ins_code
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.auth_seq_id
+_atom_site.auth_asym_id
+_atom_site.pdbx_formal_charge
+_atom_site.pdbx_PDB_model_num
+ATOM 1 CA . MET A ? 11.104 13.207 2.100 1 A ? 1
+ATOM 2 CA A GLY A ? 12.560 13.207 2.100 2 A ? 1
+ATOM 3 CA B GLY A ? 12.960 13.207 2.100 2 A ? 1
+ATOM 4 CA . MSE A A 13.104 14.207 3.100 2 A ? 1
+ATOM 5 CA . TRP B ? 14.560 14.207 3.100 7 B ? 1
+HETATM 6 "O5'" . HOH A ? 1.000 2.000 3.000 100 A ? 1
+ATOM 7 CA . MET A ? 21.104 13.207 2.100 1 A ? 2
+#
+"""
+
+
+class TestAdapters(unittest.TestCase):
+
+    def test_local_adapter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "nested"))
+            for i in range(12):
+                with open(
+                    os.path.join(tmp, "nested" if i % 2 else "", f"{i}.pdb"), "w"
+                ) as file:
+                    file.write(PDB.replace("11.104", f"{10 + i:6.3f}"))
+            with open(os.path.join(tmp, "broken.cif"), "w") as file:
+                file.write("not a structure")
+            proteins = LocalAdapter(tmp).download()
+            self.assertEqual(len(proteins), 13)
+            expected = list(proteins)
+            # the broken file is skipped
+            self.assertEqual(len(expected), 12)
+            parallel = LocalAdapter(tmp, num_workers=2, chunk_size=5).download()
+            self.assertEqual(
+                [p["coords"].tolist() for p in parallel],
+                [p["coords"].tolist() for p in expected],
+            )
+            self.assertEqual(expected[0]["ID"], "0")
+            unordered = LocalAdapter(tmp, num_workers=2, chunk_size=1, ordered=False)
+            self.assertEqual(len(list(unordered.download())), 12)
+
+    def test_archives(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with gzip.open(os.path.join(tmp, "a.pdb.gz"), "wb") as file:
+                file.write(PDB.encode())
+            with tarfile.open(os.path.join(tmp, "b.tar.gz"), "w:gz") as archive:
+                for name, data in [("x/b1.pdb", PDB), ("b2.cif", CIF)]:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data.encode())
+                    archive.addfile(info, io.BytesIO(data.encode()))
+            with zipfile.ZipFile(os.path.join(tmp, "c.zip"), "w") as archive:
+                archive.writestr("c1.pdb.gz", gzip.compress(PDB.encode()))
+                archive.writestr("README.txt", "not a structure")
+            proteins = LocalAdapter(tmp).download()
+            # the compressed tar archive is counted as one file, without decompressing it
+            with mock.patch("tarfile.open", wraps=tarfile.open) as open_tar:
+                self.assertEqual(len(LocalAdapter(tmp).download()), 3)
+            open_tar.assert_not_called()
+            proteins = list(proteins)
+            self.assertEqual([p["ID"] for p in proteins], ["a", "b1", "b2", "c1"])
+            self.assertEqual(proteins[2]["sequence"], "MGMW")
+            for protein in proteins[:2] + proteins[3:]:
+                self.assertEqual(protein["sequence"], "MG")
+            parallel = LocalAdapter(tmp, num_workers=2, chunk_size=1).download()
+            self.assertEqual([p["ID"] for p in parallel], ["a", "b1", "b2", "c1"])
+            # nothing is extracted
+            self.assertEqual(len(os.listdir(tmp)), 3)
+
+    def test_compression(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "a.pdb.bz2"), "wb") as file:
+                file.write(bz2.compress(PDB.encode()))
+            with open(os.path.join(tmp, "b.cif.xz"), "wb") as file:
+                file.write(lzma.compress(CIF.encode()))
+            with tarfile.open(os.path.join(tmp, "c.tar.xz"), "w:xz") as archive:
+                info = tarfile.TarInfo("c.pdb")
+                info.size = len(PDB.encode())
+                archive.addfile(info, io.BytesIO(PDB.encode()))
+            # an unknown compression is skipped instead of being parsed as text
+            with open(os.path.join(tmp, "d.pdb.zst"), "wb") as file:
+                file.write(b"\x28\xb5\x2f\xfd")
+            with mock.patch("proteinshake.adapters.local_adapter.warn") as warning:
+                proteins = list(LocalAdapter(tmp).download())
+            self.assertEqual([p["ID"] for p in proteins], ["a", "b", "c"])
+            self.assertEqual([p["sequence"] for p in proteins], ["MG", "MGMW", "MG"])
+            self.assertIn("d.pdb.zst", warning.call_args.args[0])
+        # structures without C-alpha atoms are errors, not empty proteins
+        for data, format in [
+            (b"HEADER\nEND\n", "pdb"),
+            (CIF.replace(" CA ", " N "), "cif"),
+        ]:
+            with self.assertRaises(ValueError):
+                Processor.parse(
+                    data if isinstance(data, bytes) else data.encode(), format
+                )
+
+    def test_synthetic_adapter(self):
+        # more proteins than a chunk, and a last chunk that is not full
+        proteins = SyntheticAdapter().download(n=5000, length=None, chunk_size=2048)
+        self.assertEqual(len(proteins), 5000)
+        proteins = list(proteins)
+        self.assertEqual(len(proteins), 5000)
+        self.assertEqual(proteins[-1]["ID"], "protein_4999")
+        lengths = [len(p["coords"]) for p in proteins]
+        self.assertTrue(all(30 <= length <= 2000 for length in lengths))
+        self.assertEqual(lengths, [len(p["sequence"]) for p in proteins])
+        self.assertEqual(
+            {len(p["coords"]) for p in SyntheticAdapter().download(n=3, length=50)},
+            {50},
+        )
+        # the output only depends on the seed
+        reference = list(SyntheticAdapter().download(n=20, length=None, random_seed=1))
+        for seed, same in [(1, True), (2, False)]:
+            proteins = list(
+                SyntheticAdapter().download(n=20, length=None, random_seed=seed)
+            )
+            self.assertEqual(proteins == reference, same)
+
+    def test_incremental_release(self):
+        for columnar in [True, False]:
+            with tempfile.TemporaryDirectory() as tmp:
+                source = os.path.join(tmp, "source")
+                os.makedirs(source)
+
+                class LocalDataset(Dataset):
+                    def release(self, version=None):
+                        previous = self.latest_local_version
+                        proteins = LocalAdapter(source, chunk_size=2).download(
+                            previous and self.root / previous
+                        )
+                        # the manifest is passed through modifiers
+                        proteins = RandomSplit()(proteins)
+                        return self.save(proteins, version, columnar, block_size=2)
+
+                def write(name, x):
+                    with open(os.path.join(source, name), "w") as file:
+                        file.write(PDB.replace("12.560", f"{x:6.3f}"))
+
+                for i in range(5):
+                    write(f"{i}.pdb", 10 + i)
+                with zipfile.ZipFile(os.path.join(source, "5.zip"), "w") as archive:
+                    archive.writestr("5.pdb", PDB)
+                dataset = LocalDataset(root=tmp, online=False)
+                dataset.release("2024Jan01")
+                write("1.pdb", 20)  # changed
+                write("6.pdb", 30)  # added
+                os.remove(os.path.join(source, "3.pdb"))
+                # touched, but with the same content
+                os.utime(os.path.join(source, "4.pdb"), (0, 0))
+                with mock.patch.object(
+                    Processor, "process", wraps=Processor.process
+                ) as process:
+                    dataset.release("2024Jan02")
+                self.assertEqual(
+                    sorted(call.args[0] for call in process.call_args_list),
+                    [os.path.join(source, name) for name in ["1.pdb", "6.pdb"]],
+                )
+                dataset = LocalDataset(root=tmp, version="2024Jan02", online=False)
+                proteins = list(dataset.proteins())
+                self.assertEqual(
+                    [p["ID"] for p in proteins], ["0", "1", "2", "4", "5", "6"]
+                )
+                self.assertTrue(
+                    np.allclose(
+                        [p["coords"][0][0] for p in proteins],
+                        [10, 20, 12, 14, 12.56, 30],
+                    )
+                )
+                manifest = load(dataset.path / "manifest.json")
+                self.assertEqual(manifest["5.zip:5.pdb"]["ID"], "5")
+                # without a manifest, all files are processed again
+                os.remove(dataset.root / dataset.latest_local_version / "manifest.json")
+                with mock.patch.object(
+                    Processor, "process", wraps=Processor.process
+                ) as process, mock.patch(
+                    "proteinshake.adapters.local_adapter.warn"
+                ) as warning:
+                    dataset.release("2024Jan03")
+                self.assertEqual(process.call_count, 6)
+                self.assertIn("no manifest", warning.call_args.args[0])
+
+    def test_processor(self):
+        for data, format in [(MODELS, "pdb"), (CIF, "cif")]:
+            fast = Processor.parse(data.encode(), format)
+            self.assertEqual(fast["sequence"], "MGMW")
+            self.assertEqual(fast["coords"].dtype, np.float32)
+            self.assertTrue(
+                np.allclose(fast["coords"][:, 0], [11.104, 12.56, 13.104, 14.56])
+            )
+            self.assertEqual(fast["residue_number"].tolist(), [1, 2, 2, 7])
+            self.assertEqual(fast["chain"].tolist(), [0, 0, 0, 1])
+            self.assertEqual(fast["chain_ids"], "A,B")
+        # the biopandas fallback gives the same result
+        reference = Processor._parse_biopandas(MODELS.encode(), "pdb")
+        for key, value in fast.items():
+            self.assertTrue(np.array_equal(value, reference[key]), key)
+        self.assertEqual(Processor.identifier("data/1abc.pdb.gz"), "1abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
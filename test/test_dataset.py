@@ -0,0 +1,185 @@
+import unittest, tempfile, shutil
+from pathlib import Path
+from fastavro import reader as avro_reader, writer as avro_writer
+from proteinshake.dataset import Dataset
+from proteinshake.adapters import SyntheticAdapter
+from proteinshake.utils import dict_to_avro_schema, save, Predicate, ProteinGenerator
+import numpy as np
+
+
+class TestDataset(unittest.TestCase):
+
+    def _dataset(self, tmp, **kwargs):
+        class TestDataset(Dataset):
+            def release(self, version: str = None):
+                proteins = SyntheticAdapter().download()
+                return self.save(proteins, version, **kwargs)
+
+        return TestDataset(root=tmp, online=False)
+
+    def _avro(self, dataset):
+        with open(dataset.path / "proteins.avro", "rb") as file:
+            return list(avro_reader(file))
+
+    def test_hash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = self._dataset(tmp)
+            key = dataset.hash()
+            # independent of where the version is stored
+            shutil.copytree(dataset.root, Path(tmp) / "copy" / dataset.root.name)
+            copy = type(dataset)(root=Path(tmp) / "copy", online=False)
+            self.assertEqual(copy.hash(), key)
+            # a version released again under the same name has a new hash
+            shutil.rmtree(dataset.path)
+            dataset.release(dataset.path.name)
+            self.assertNotEqual(dataset.hash(), key)
+
+    def test_unindexed_version(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = self._dataset(tmp)
+            proteins = list(SyntheticAdapter().download())
+            # a version as saved by earlier releases, without index and columnar store
+            path = dataset.root / "2023Jan01"
+            path.mkdir()
+            save({}, path / "assets.json")
+            with open(path / "proteins.avro", "wb") as file:
+                avro_writer(
+                    file,
+                    dict_to_avro_schema(proteins[0]),
+                    proteins,
+                    metadata={"number_of_proteins": str(len(proteins))},
+                )
+            legacy = type(dataset)(root=tmp, version="2023Jan01", online=False)
+            self.assertEqual(len(legacy.proteins()), 10)
+            self.assertEqual(
+                [p["ID"] for p in legacy.proteins()], [p["ID"] for p in proteins]
+            )
+            train = list(legacy.proteins(columns=["ID"], where={"split": "train"}))
+            self.assertEqual(
+                [p["ID"] for p in train],
+                [p["ID"] for p in proteins if p["split"] == "train"],
+            )
+            self.assertEqual(set(train[0].keys()), {"ID"})
+            self.assertNotEqual(legacy.hash(), dataset.hash())
+            with self.assertRaisesRegex(FileNotFoundError, "Release the version"):
+                legacy[0]
+
+    def test_columnar(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = self._dataset(tmp)
+            proteins = list(dataset.proteins())
+            self.assertEqual(len(proteins), len(dataset.proteins()))
+            for protein, expected in zip(proteins, self._avro(dataset)):
+                self.assertIsInstance(protein["coords"], np.ndarray)
+                self.assertFalse(protein["coords"].flags.writeable)
+                self.assertTrue(np.array_equal(protein["coords"], expected["coords"]))
+                for key in ["ID", "sequence", "label", "split"]:
+                    self.assertEqual(protein[key], expected[key])
+
+    def test_avro_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = self._dataset(tmp, columnar=False)
+            self.assertEqual(list(dataset.proteins()), self._avro(dataset))
+
+    def test_parallel_decoding(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = self._dataset(tmp, columnar=False, block_size=3)
+            expected = self._avro(dataset)
+            self.assertEqual(list(dataset.proteins(num_workers=2)), expected)
+            proteins = list(dataset.proteins(num_workers=2, ordered=False))
+            self.assertEqual(
+                sorted(p["ID"] for p in proteins), sorted(p["ID"] for p in expected)
+            )
+
+    def test_columns(self):
+        for columnar in [True, False]:
+            with tempfile.TemporaryDirectory() as tmp:
+                dataset = self._dataset(tmp, columnar=columnar, block_size=3)
+                proteins = list(dataset.proteins(columns=["sequence", "split"]))
+                self.assertEqual(len(proteins), 10)
+                self.assertEqual(set(proteins[0].keys()), {"sequence", "split"})
+                self.assertEqual(
+                    set(dataset.get([1], columns=["ID"])[0].keys()), {"ID"}
+                )
+                with self.assertRaises(KeyError):
+                    dataset.proteins(columns=["missing"])
+
+    def test_where(self):
+        for columnar in [True, False]:
+            with tempfile.TemporaryDirectory() as tmp:
+                dataset = self._dataset(tmp, columnar=columnar, block_size=3)
+                expected = self._avro(dataset)
+                stats = dataset.index["blocks"][0]["stats"]
+                self.assertEqual(stats["__length__"], {"min": 300, "max": 300})
+                self.assertEqual(sum(stats["split"]["values"].values()), 3)
+                where = {"split": "train", "label": (None, 50)}
+                proteins = list(dataset.proteins(columns=["ID"], where=where))
+                self.assertEqual(
+                    [p["ID"] for p in proteins],
+                    [
+                        p["ID"]
+                        for p in expected
+                        if p["split"] == "train" and p["label"] <= 50
+                    ],
+                )
+                self.assertEqual(set(proteins[0].keys()), {"ID"})
+                proteins = dataset.proteins(where={"length": (301, None)})
+                self.assertEqual(len(proteins), 0)
+                self.assertEqual(list(proteins), [])
+
+    def test_predicate(self):
+        # blocks are not skipped if the condition cannot be compared with their statistics
+        self.assertTrue(
+            Predicate({"label": ("a", None)}).may_match({"label": {"min": 0, "max": 5}})
+        )
+        self.assertTrue(
+            Predicate({"split": (1, 2)}).may_match({"split": {"values": {"train": 3}}})
+        )
+        self.assertFalse(
+            Predicate({"label": (6, None)}).may_match({"label": {"min": 0, "max": 5}})
+        )
+        # a protein field named length takes precedence over the virtual field
+        with tempfile.TemporaryDirectory() as tmp:
+
+            class LengthDataset(Dataset):
+                def release(self, version=None):
+                    proteins = SyntheticAdapter().download()
+                    proteins = ProteinGenerator(
+                        ({**p, "length": p["label"]} for p in proteins), 10, {}
+                    )
+                    return self.save(proteins, version, block_size=3)
+
+            dataset = LengthDataset(root=tmp, online=False)
+            stats = dataset.index["blocks"][0]["stats"]
+            self.assertEqual(stats["__length__"], {"min": 300, "max": 300})
+            expected = [p["ID"] for p in self._avro(dataset) if p["label"] < 50]
+            for columns in [None, ["ID"]]:
+                proteins = dataset.proteins(
+                    columns=columns, where={"length": (None, 49)}
+                )
+                self.assertEqual([p["ID"] for p in proteins], expected)
+
+    def test_random_access(self):
+        for columnar in [True, False]:
+            with tempfile.TemporaryDirectory() as tmp:
+                dataset = self._dataset(tmp, columnar=columnar, block_size=3)
+                expected = self._avro(dataset)
+                self.assertEqual(len(dataset.index["blocks"]), 4)
+                self.assertEqual(dataset[4]["ID"], expected[4]["ID"])
+                self.assertEqual(dataset[-1]["ID"], expected[-1]["ID"])
+                self.assertEqual(
+                    dataset["protein_7"]["sequence"], expected[7]["sequence"]
+                )
+                proteins = dataset.get(["protein_9", 0, "protein_5", 2])
+                self.assertEqual(
+                    [p["ID"] for p in proteins],
+                    ["protein_9", "protein_0", "protein_5", "protein_2"],
+                )
+                with self.assertRaises(KeyError):
+                    dataset["missing"]
+                with self.assertRaises(IndexError):
+                    dataset[10]
+
+
+if __name__ == "__main__":
+    unittest.main()
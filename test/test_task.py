@@ -0,0 +1,634 @@
+import unittest, tempfile, os, threading
+from unittest import mock
+from pathlib import Path
+from proteinshake.dataset import Dataset
+from proteinshake.task import Task
+from proteinshake.targets import AttributeTarget
+from proteinshake.metrics import AccuracyMetric
+from proteinshake.transforms import (
+    MinMaxScalerTransform,
+    RandomRotationTransform,
+    GaussianNoiseTransform,
+    RandomCropTransform,
+    ResidueMaskTransform,
+)
+from proteinshake.representations import PointRepresentationTransform
+from proteinshake.transform import DataTransform, StochasticTransform
+from proteinshake.utils import (
+    ProteinGenerator,
+    amino_acid_alphabet,
+    directory_size,
+    load_shard,
+    ShardLoader,
+    ShardWriter,
+    token_batches,
+    load,
+    partition_shards,
+)
+import numpy as np
+
+try:
+    import torch
+    from proteinshake.frameworks import TorchFrameworkTransform
+except ImportError:
+    torch = None
+
+
+class CountingTransform(DataTransform):
+    calls = 0
+
+    def transform(self, X):
+        CountingTransform.calls += 1
+        return X
+
+    def create_loader(self, iterator, **kwargs):
+        return iterator()
+
+
+class FeatureTransform(DataTransform):
+    calls = 0
+
+    def transform(self, X):
+        FeatureTransform.calls += 1
+        return X
+
+
+def reference_batches(shards, batch_size, rng=None):
+    # the original batch assembly, which is correct if batch_size is None
+    for current_shard in shards:
+        current_X, current_y = current_shard
+        X_batch, y_batch = [], []
+        while len(X_batch) < (batch_size or np.inf):
+            if batch_size is None:
+                b = len(current_X)
+            else:
+                b = batch_size - len(X_batch)
+            X_piece, current_X = current_X[:b], current_X[b:]
+            y_piece, current_y = current_y[:b], current_y[b:]
+            X_batch = X_batch + list(X_piece)
+            y_batch = y_batch + list(y_piece)
+            if len(current_X) == 0:
+                try:
+                    current_shard = next(shards)
+                    current_X, current_y = current_shard
+                except StopIteration:
+                    break
+        X_batch, y_batch = np.asarray(X_batch), np.asarray(y_batch)
+        if rng is not None:
+            permutation = rng.permutation(len(X_batch))
+            X_batch, y_batch = X_batch[permutation], y_batch[permutation]
+        yield X_batch, y_batch
+
+
+class FailingTransform(DataTransform):
+    calls = 0
+
+    def transform(self, X):
+        FailingTransform.calls += 1
+        if FailingTransform.calls == 3:
+            raise RuntimeError("transform failed")
+        return X
+
+
+class NoiseTransform(StochasticTransform):
+    def transform(self, Xy, seeds):
+        X, y = Xy
+        noise = [np.random.default_rng(seed).normal(size=X.shape[1:]) for seed in seeds]
+        return X + np.asarray(noise), y
+
+
+class TestTask(unittest.TestCase):
+
+    def _task(
+        self, tmp, n=50, dataset_root="datasets", variable_length=False, profile=False
+    ):
+        class TestDataset(Dataset):
+            def release(self, version: str = None):
+                rng = np.random.default_rng(0)
+                lengths = rng.integers(5, 60, size=n) if variable_length else [30] * n
+                proteins = [
+                    {
+                        "ID": f"protein_{i}",
+                        "coords": rng.integers(0, 100, size=(length, 3)).tolist(),
+                        "sequence": "".join(
+                            rng.choice(list(amino_acid_alphabet), length)
+                        ),
+                        "label": int(rng.integers(100)),
+                        "split": str(rng.choice(["train", "test", "val"])),
+                    }
+                    for i, length in enumerate(lengths)
+                ]
+                proteins = ProteinGenerator(iter(proteins), n, {})
+                return self.save(proteins, version)
+
+        class TestTask(Task):
+            dataset = TestDataset(root=os.path.join(tmp, dataset_root), online=False)
+            target = AttributeTarget()
+            metrics = AccuracyMetric()
+
+        return TestTask(root=os.path.join(tmp, "tasks"), shard_size=4, profile=profile)
+
+    def _labels(self, task):
+        return {
+            split: np.concatenate([y for _, y in task.loader(split=split)])
+            for split in ["train", "test", "val"]
+        }
+
+    def test_routing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            proteins = list(
+                self._task(tmp).dataset.proteins(columns=["label", "split"])
+            )
+            # the data is streamed once, and a second time only to fit transforms
+            for transforms, passes in [
+                ([CountingTransform()], 1),
+                ([MinMaxScalerTransform(), CountingTransform()], 2),
+            ]:
+                task = self._task(tmp)
+                with mock.patch.object(
+                    task.dataset, "proteins", wraps=task.dataset.proteins
+                ) as stream:
+                    task.transform(*transforms, force=True)
+                self.assertEqual(stream.call_count, passes)
+            task = self._task(tmp).transform(CountingTransform())
+            for split, y in self._labels(task).items():
+                expected = [p["label"] for p in proteins if p["split"] == split]
+                self.assertEqual(y.tolist(), expected)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            CountingTransform.calls = 0
+            task = self._task(tmp).transform(
+                MinMaxScalerTransform(), CountingTransform()
+            )
+            num_shards = CountingTransform.calls
+            labels = self._labels(task)
+            task = self._task(tmp).transform(
+                MinMaxScalerTransform(), CountingTransform()
+            )
+            self.assertEqual(CountingTransform.calls, num_shards)
+            os.remove(task.cache_path / "train" / "shards" / "1.pkl")
+            with open(task.cache_path / "test" / "shards" / "0.pkl", "ab") as file:
+                file.write(b"corrupt")
+            task = self._task(tmp).transform(
+                MinMaxScalerTransform(), CountingTransform()
+            )
+            self.assertEqual(CountingTransform.calls, num_shards + 2)
+            for split, y in self._labels(task).items():
+                self.assertTrue(np.array_equal(y, labels[split]))
+            task = self._task(tmp).transform(
+                MinMaxScalerTransform(), CountingTransform(), force=True
+            )
+            self.assertEqual(CountingTransform.calls, 2 * num_shards + 2)
+
+    def test_cache_reuse(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            CountingTransform.calls = 0
+            task = self._task(tmp).transform(CountingTransform())
+            num_shards = CountingTransform.calls
+            # a complete cache does not stream the dataset
+            task = self._task(tmp)
+            with mock.patch.object(
+                task.dataset, "proteins", wraps=task.dataset.proteins
+            ) as stream:
+                task.transform(CountingTransform())
+            self.assertEqual(stream.call_count, 0)
+            self.assertEqual(CountingTransform.calls, num_shards)
+            # corruption of the same size is only detected by the checksums
+            path = task.cache_path / "train" / "shards" / "0.pkl"
+            data = bytearray(path.read_bytes())
+            data[-2] ^= 1
+            path.write_bytes(bytes(data))
+            self._task(tmp).transform(CountingTransform())
+            self.assertEqual(CountingTransform.calls, num_shards)
+            self._task(tmp).transform(CountingTransform(), verify=True)
+            self.assertEqual(CountingTransform.calls, num_shards + 1)
+
+    def test_failed_transform(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            opened = []
+            with mock.patch(
+                "proteinshake.utils.shards.open",
+                side_effect=lambda *args: opened.append(open(*args)) or opened[-1],
+                create=True,
+            ):
+                FailingTransform.calls = 0
+                with self.assertRaises(RuntimeError):
+                    self._task(tmp).transform(FailingTransform(), CountingTransform())
+            # the manifests of the partial cache are closed
+            self.assertTrue(len(opened) > 0)
+            self.assertTrue(all(file.closed for file in opened))
+            task = self._task(tmp).transform(
+                FailingTransform(), CountingTransform(), force=True
+            )
+            self.assertEqual(sum(len(y) for y in self._labels(task).values()), 50)
+
+    def test_cache_key(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp).transform(MinMaxScalerTransform())
+            scaler = task.transform.transforms[1]
+            key, fitted_key = task.cache_key(), task.cache_key(fitted=True)
+            self.assertEqual(task.cache_path.name, fitted_key)
+            scaler.max += 1
+            self.assertEqual(task.cache_key(), key)
+            self.assertNotEqual(task.cache_key(fitted=True), fitted_key)
+            task = self._task(tmp, n=40, dataset_root="other").transform(
+                MinMaxScalerTransform()
+            )
+            self.assertNotEqual(task.cache_key(), key)
+
+    def test_prefix_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            CountingTransform.calls = FeatureTransform.calls = 0
+            task = self._task(tmp).transform(FeatureTransform(), CountingTransform())
+            num_shards = FeatureTransform.calls
+            labels = self._labels(task)
+            task = self._task(tmp).transform(
+                FeatureTransform(), FeatureTransform(), CountingTransform()
+            )
+            self.assertEqual(FeatureTransform.calls, 2 * num_shards)
+            self.assertEqual(CountingTransform.calls, 2 * num_shards)
+            for split, y in self._labels(task).items():
+                self.assertTrue(np.array_equal(y, labels[split]))
+
+    def test_cache_budget(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first = self._task(tmp).transform(CountingTransform()).cache_path
+            task = self._task(tmp)
+            task.cache.budget = directory_size(first)
+            task.transform(MinMaxScalerTransform(), CountingTransform())
+            self.assertFalse(os.path.exists(first))
+            self.assertTrue(os.path.exists(task.cache_path))
+            # directories that are not caches are never evicted
+            other = Path(tmp) / "tasks" / "other" / "results"
+            os.makedirs(other)
+            (other / "data").write_bytes(bytes(1000))
+            task = self._task(tmp)
+            task.cache.budget = 0
+            task.transform(MinMaxScalerTransform(), CountingTransform())
+            self.assertTrue(os.path.exists(task.cache_path))
+            self.assertTrue(os.path.exists(other / "data"))
+
+    def test_numeric_shards(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp).transform(
+                PointRepresentationTransform(), CountingTransform()
+            )
+            path = task.cache_path / "train" / "shards"
+            self.assertTrue(os.path.exists(path / "0.bin"))
+            X, y = load_shard(path / "0")
+            self.assertIsInstance(X, np.memmap)
+            self.assertEqual(X.shape, (4, 1, 30, 3))
+            proteins = [
+                p
+                for p in task.dataset.proteins(columns=["coords", "label", "split"])
+                if p["split"] == "train"
+            ]
+            X, y = map(np.concatenate, zip(*task.loader(split="train")))
+            self.assertTrue(
+                np.array_equal(X[:, 0], [protein["coords"] for protein in proteins])
+            )
+            self.assertTrue(
+                np.array_equal(y, [protein["label"] for protein in proteins])
+            )
+
+    def _shards(self, tmp):
+        rng = np.random.default_rng(0)
+        path = Path(tmp) / "shards"
+        writer = ShardWriter([(path, None)], 4)
+        for i in range(22):
+            writer.append(((rng.random((5, 3)),), i))
+        writer.close()
+        return path, [load_shard(path / str(i)) for i in range(6)]
+
+    def test_batches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path, shards = self._shards(tmp)
+            batches = list(ShardLoader(path))
+            expected = list(reference_batches(iter(shards), None))
+            self.assertEqual(len(batches), len(expected))
+            for (X, y), (X_ref, y_ref) in zip(batches, expected):
+                self.assertTrue(np.array_equal(X, X_ref))
+                self.assertTrue(np.array_equal(y, y_ref))
+                self.assertEqual(y.dtype, y_ref.dtype)
+            X_all, y_all = map(np.concatenate, zip(*shards))
+            for batch_size in [1, 3, 4, 8, 30]:
+                batches = list(ShardLoader(path, batch_size=batch_size))
+                self.assertEqual(len(batches), -(-len(y_all) // batch_size))
+                for i, (X, y) in enumerate(batches):
+                    chunk = slice(i * batch_size, (i + 1) * batch_size)
+                    self.assertTrue(np.array_equal(X, X_all[chunk]))
+                    self.assertTrue(np.array_equal(y, y_all[chunk]))
+
+    def test_shuffle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path, _ = self._shards(tmp)
+            for shuffle_buffer in [0, 8]:
+                loader = ShardLoader(
+                    path,
+                    batch_size=4,
+                    shuffle=True,
+                    random_seed=0,
+                    shuffle_buffer=shuffle_buffer,
+                )
+                epoch = [y for _, y in loader]
+                self.assertEqual(sorted(np.concatenate(epoch)), list(range(22)))
+                self.assertEqual(loader.state_dict(), {"epoch": 1, "batches": 0})
+                self.assertFalse(
+                    np.array_equal(
+                        np.concatenate([y for _, y in loader]), np.concatenate(epoch)
+                    )
+                )
+                # resume mid-epoch in a new loader
+                loader.load_state_dict({"epoch": 0, "batches": 0})
+                iterator = loader()
+                next(iterator), next(iterator)
+                state = loader.state_dict()
+                self.assertEqual(state, {"epoch": 0, "batches": 2})
+                resumed = ShardLoader(
+                    path,
+                    batch_size=4,
+                    shuffle=True,
+                    random_seed=0,
+                    shuffle_buffer=shuffle_buffer,
+                )
+                resumed.load_state_dict(state)
+                rest = [y for _, y in resumed]
+                self.assertEqual(len(rest), len(epoch) - 2)
+                for y, y_ref in zip(rest, epoch[2:]):
+                    self.assertTrue(np.array_equal(y, y_ref))
+            # the shuffle buffer mixes items of different shards into a batch
+            self.assertTrue(any(len(set(y // 4)) > 2 for y in epoch))
+            # the loaders of different ranks agree on the order without an explicit seed
+            y = [
+                y
+                for rank in range(2)
+                for _, y in ShardLoader(path, batch_size=4, shuffle=True)(rank, 2)
+            ]
+            self.assertEqual(sorted(np.concatenate(y)), list(range(22)))
+
+    def test_max_tokens(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp, variable_length=True).transform(CountingTransform())
+            path = task.cache_path / "train" / "shards"
+            lengths = load(path / "lengths.npy")
+            proteins = [
+                protein
+                for protein in task.dataset.proteins(
+                    columns=["ID", "sequence", "split"]
+                )
+                if protein["split"] == "train"
+            ]
+            self.assertEqual(lengths.tolist(), [len(p["sequence"]) for p in proteins])
+            batches = list(task.loader(split="train", max_tokens=100, shuffle=True))
+            X = np.concatenate([X[:, 0] for X, _ in batches])
+            self.assertEqual(
+                sorted(p["ID"] for p in X), sorted(p["ID"] for p in proteins)
+            )
+            for X, _ in batches:
+                longest = max(len(p["sequence"]) for p in X[:, 0])
+                self.assertTrue(len(X) == 1 or len(X) * longest <= 100)
+            self.assertLess(len(batches), len(proteins))
+            self.assertEqual(token_batches([5, 10, 10, 30, 200], 40, 3), [0, 3, 4, 5])
+
+    def test_point_modes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp, variable_length=True)
+            coords = [
+                np.asarray(protein["coords"], dtype=np.float32)
+                for protein in task.dataset.proteins(columns=["coords", "split"])
+                if protein["split"] == "train"
+            ]
+            lengths = [len(c) for c in coords]
+            task.transform(
+                PointRepresentationTransform(mode="padded"), CountingTransform()
+            )
+            self.assertTrue(
+                os.path.exists(task.cache_path / "train" / "shards" / "0.bin")
+            )
+            (X, mask), _ = next(task.loader(split="train"))
+            self.assertEqual(X.dtype, np.float32)
+            self.assertEqual(X.shape, (len(coords), 1, max(lengths), 3))
+            self.assertEqual(mask[:, 0].sum(axis=1).tolist(), lengths)
+            for x, m, c in zip(X[:, 0], mask[:, 0], coords):
+                self.assertTrue(np.array_equal(x[m], c))
+                self.assertFalse(x[~m].any())
+            task = self._task(tmp, variable_length=True).transform(
+                PointRepresentationTransform(mode="packed"), CountingTransform()
+            )
+            (values, offsets), _ = next(task.loader(split="train"))
+            self.assertEqual(np.diff(offsets).tolist(), lengths)
+            self.assertTrue(np.array_equal(values, np.concatenate(coords)))
+
+    def test_mixed_shards(self):
+        # shards of proteins of equal length are dense, the others ragged
+        with tempfile.TemporaryDirectory() as tmp:
+            lengths = [5, 5, 7, 7, 9, 9, 5, 7]
+            writer = ShardWriter([(Path(tmp), PointRepresentationTransform())], 2)
+            for i, length in enumerate(lengths):
+                writer.append((({"coords": np.full((length, 3), i).tolist()},), i))
+            writer.close()
+            for batch_workers in [0, 2]:
+                loader = ShardLoader(tmp, batch_size=4, batch_workers=batch_workers)
+                batches = list(loader)
+                self.assertEqual(len(batches), 2)
+                for X, y in batches:
+                    self.assertEqual(X.shape, (4, 1))
+                    for x, label in zip(X[:, 0], y):
+                        self.assertEqual(x.shape, (lengths[label], 3))
+                        self.assertTrue(np.all(x == label))
+
+    def test_augmentations(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp, variable_length=True).transform(
+                PointRepresentationTransform(mode="packed"),
+                CountingTransform(),
+                RandomRotationTransform(),
+                RandomCropTransform(size=8),
+                GaussianNoiseTransform(std=0.1),
+                ResidueMaskTransform(),
+            )
+
+            def proteins(**kwargs):
+                loader = task.loader(split="train", random_seed=0, **kwargs)
+                return [
+                    (values[low:high], masked[low:high])
+                    for ((values, offsets), masked), _ in loader
+                    for low, high in zip(offsets[:-1], offsets[1:])
+                ]
+
+            reference = proteins()
+            self.assertTrue(all(len(p) <= 8 for p, _ in reference))
+            masked = np.concatenate([m for _, m in reference])
+            self.assertTrue(0 < masked.sum() < len(masked))
+            self.assertFalse(np.concatenate([p for p, _ in reference])[masked].any())
+            # every protein draws from its own stream, independently of the batching
+            batched = proteins(batch_size=3, batch_workers=2)
+            self.assertEqual(len(batched), len(reference))
+            for (a, mask_a), (b, mask_b) in zip(reference, batched):
+                self.assertTrue(np.array_equal(a, b))
+                self.assertTrue(np.array_equal(mask_a, mask_b))
+            # the mask has the layout of the coordinates
+            X = np.ones((4, 1, 10, 3))
+            (Y, masked), _ = ResidueMaskTransform(0.5)((X, np.zeros(4)), np.arange(4))
+            self.assertEqual(masked.shape, (4, 1, 10))
+            self.assertFalse(Y[masked].any())
+            self.assertTrue(Y[~masked].all())
+            mask = np.arange(10) < np.arange(4, 8)[:, None, None]
+            (Y, padding), masked = ResidueMaskTransform(0.5)(
+                ((X, mask), np.zeros(4)), np.arange(4)
+            )[0]
+            # the padding is trimmed to the longest protein
+            self.assertTrue(np.array_equal(padding, mask[..., :7]))
+            self.assertEqual(masked.shape, padding.shape)
+            self.assertFalse((masked & ~padding).any())
+            rotation = RandomRotationTransform()
+            X = np.random.default_rng(0).normal(size=(4, 1, 10, 3))
+            Y, _ = rotation((X, np.zeros(4)), np.arange(4, dtype=np.uint64))
+            distances = lambda X: np.linalg.norm(
+                X[..., None, :] - X[..., None, :, :], axis=-1
+            )
+            self.assertTrue(np.allclose(distances(X), distances(Y)))
+            self.assertFalse(np.allclose(X, Y))
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp, profile=True).transform(
+                PointRepresentationTransform(), CountingTransform(), NoiseTransform()
+            )
+            stages = task.stats.report()["stages"]
+            self.assertEqual(stages["decode"]["items"], 50)
+            self.assertEqual(stages["shard write"]["items"], 100)
+            for batch_workers in [0, 2]:
+                list(task.loader(split="train", batch_workers=batch_workers))
+            report = load(task.root / f"{task.cache_path.name}.stats.json")
+            self.assertEqual(report["stages"]["stochastic/NoiseTransform"]["calls"], 2)
+            self.assertGreater(report["stages"]["shard read"]["items"], 0)
+            self.assertGreater(report["peak_memory"], 0)
+            self.assertIsNone(self._task(tmp).stats)
+
+    def test_batch_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp).transform(
+                PointRepresentationTransform(), CountingTransform(), NoiseTransform()
+            )
+
+            def epoch(random_seed=0, **kwargs):
+                loader = task.loader(split="train", random_seed=random_seed, **kwargs)
+                return np.concatenate([X for X, _ in loader])
+
+            X = epoch(batch_size=5)
+            self.assertTrue(np.array_equal(epoch(batch_size=3, batch_workers=2), X))
+            self.assertTrue(np.array_equal(epoch(batch_workers=1), X))
+            self.assertFalse(np.array_equal(epoch(batch_size=5, random_seed=1), X))
+            loader = task.loader(split="train", batch_size=2, batch_workers=2)
+            next(loader)
+            loader.close()
+
+    def test_prefetch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp).transform(CountingTransform())
+            labels = self._labels(task)
+            threads = threading.active_count()
+            y = np.concatenate(
+                [y for _, y in task.loader(split="train", batch_size=3, prefetch=2)]
+            )
+            self.assertTrue(np.array_equal(y, labels["train"]))
+            loader = task.loader(split="train", batch_size=3, prefetch=2)
+            next(loader)
+            self.assertEqual(threading.active_count(), threads + 1)
+            loader.close()
+            self.assertEqual(threading.active_count(), threads)
+
+    def test_partitions(self):
+        sizes = [4, 4, 4, 2]
+        pieces = [partition_shards(sizes, p, 3) for p in range(3)]
+        for partition in pieces:
+            self.assertEqual(sum(stop - start for _, start, stop in partition), 5)
+        items = [
+            (i, j) for p in pieces for i, start, stop in p for j in range(start, stop)
+        ]
+        self.assertEqual(
+            set(items), {(i, j) for i, n in enumerate(sizes) for j in range(n)}
+        )
+        self.assertEqual(items[-1], (0, 0))
+        # the workers of a partition split it without padding
+        sizes = [4, 3, 3]
+        pieces = [
+            partition_shards(sizes, 0, 1, worker=w, num_workers=3) for w in range(3)
+        ]
+        self.assertEqual(
+            [sum(stop - start for _, start, stop in p) for p in pieces], [4, 3, 3]
+        )
+        items = [
+            (i, j) for p in pieces for i, start, stop in p for j in range(start, stop)
+        ]
+        self.assertEqual(items, [(i, j) for i, n in enumerate(sizes) for j in range(n)])
+
+    @unittest.skipIf(torch is None, "torch is not installed")
+    def test_torch_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp).transform(
+                PointRepresentationTransform(), TorchFrameworkTransform()
+            )
+            labels = [
+                protein["label"]
+                for protein in task.dataset.proteins(columns=["label", "split"])
+                if protein["split"] == "train"
+            ]
+            kwargs = dict(split="train", shuffle=True, random_seed=0)
+            loader = task.loader(num_workers=2, batch_size=3, **kwargs)
+            y = np.concatenate([y.numpy() for _, y in loader])
+            # every item exactly once
+            self.assertEqual(sorted(y), sorted(labels))
+            loader.set_epoch(0)
+            first = np.concatenate([y.numpy() for _, y in loader])
+            second = np.concatenate([y.numpy() for _, y in loader])
+            self.assertTrue(np.array_equal(first, y))
+            self.assertFalse(np.array_equal(first, second))
+            # the workers may have different numbers of batches
+            for num_workers, batch_size, stop in [(2, 3, 3), (3, 2, 7)]:
+                loader = task.loader(
+                    num_workers=num_workers, batch_size=batch_size, **kwargs
+                )
+                first = [y.numpy() for _, y in loader]
+                self.assertEqual(sorted(np.concatenate(first)), sorted(labels))
+                loader.set_epoch(0)
+                for i, _ in enumerate(loader):
+                    if i == stop - 1:
+                        break
+                state = loader.state_dict()
+                self.assertEqual(state, {"epoch": 0, "batches": stop})
+                loader = task.loader(
+                    num_workers=num_workers, batch_size=batch_size, **kwargs
+                )
+                loader.load_state_dict(state)
+                rest = np.concatenate([y.numpy() for _, y in loader])
+                self.assertTrue(np.array_equal(rest, np.concatenate(first[stop:])))
+
+    def test_num_workers(self):
+        def layout(task):
+            # the shard file names and index of every split
+            return {
+                split: (
+                    sorted(os.listdir(task.cache_path / split / "shards")),
+                    load(task.cache_path / split / "shards" / "index.npy").tolist(),
+                )
+                for split in ["train", "test", "val"]
+            }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            task = self._task(tmp).transform(
+                MinMaxScalerTransform(), CountingTransform()
+            )
+            labels, files = self._labels(task), layout(task)
+            task = self._task(tmp).transform(
+                MinMaxScalerTransform(), CountingTransform(), num_workers=2, force=True
+            )
+            self.assertEqual(layout(task), files)
+            for split, y in self._labels(task).items():
+                self.assertTrue(np.array_equal(y, labels[split]))
+
+
+if __name__ == "__main__":
+    unittest.main()